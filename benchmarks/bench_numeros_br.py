@@ -0,0 +1,48 @@
+"""
+Benchmark + verificação da conversão de números pt-BR em lote (clean_column_br)
+contra a versão valor a valor (clean_number_br).
+
+Uso:  python benchmarks/bench_numeros_br.py [linhas] [distintos]
+
+A equivalência com clean_number_br (amostras aleatórias, bordas, tipos mistos) é
+verificada em tests/test_numeros_br.py; aqui só se confere o lote medido.
+"""
+import os, sys, time, random
+
+sys.path[:0] = [os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+                os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "tests"))]
+import exportar_esteira_carteira as E
+from casos_numeros_br import BORDAS, mesmo_valor  # mesmas bordas dos testes
+
+def gerar(linhas: int, distintos: int, seed: int = 0):
+    rnd = random.Random(seed)
+    base = [f"R$ {rnd.randint(0, 999_999):,}".replace(",", ".") + f",{rnd.randint(0, 99):02d}"
+            for _ in range(distintos)]
+    base += [str(rnd.uniform(-1e6, 1e6)) for _ in range(distintos // 10)] + BORDAS
+    return [rnd.choice(base) for _ in range(linhas)]
+
+def medir(linhas: int, distintos: int):
+    vals = gerar(linhas, distintos)
+    t0 = time.perf_counter()
+    antigo = [E.clean_number_br(v) for v in vals]
+    t_antigo = time.perf_counter() - t0
+
+    E._clean_number_br_str.cache_clear()
+    t0 = time.perf_counter()
+    novo = E.clean_column_br(vals)
+    t_frio = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    E.clean_column_br(vals)
+    t_quente = time.perf_counter() - t0
+
+    assert all(mesmo_valor(a, b) for a, b in zip(antigo, novo))
+    motor = "numpy/pandas" if E._numpy_pandas() else "python puro"
+    print(f"{linhas:>8} valores ({distintos} distintos, {motor}) | valor a valor: {t_antigo:6.3f}s | "
+          f"lote (cache frio): {t_frio:6.3f}s | lote (cache quente): {t_quente:6.3f}s")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        medir(int(sys.argv[1]), int(sys.argv[2]))
+    else:
+        for linhas, distintos in [(100_000, 500), (100_000, 20_000), (500_000, 5_000)]:
+            medir(linhas, distintos)
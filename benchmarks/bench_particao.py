@@ -0,0 +1,42 @@
+"""
+Micro-benchmark: filtro por coluna E (uma varredura por destino) x índice único por Unidade.
+
+Uso:  python benchmarks/bench_particao.py [linhas] [destinos]
+"""
+import os, sys, time, random
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from replicar_bd_esteira import DEFAULT_HEADER, filtrar_por_col_E, indexar_por_col_E, fatia_do_indice
+
+def gerar_fonte(linhas: int, unidades: int):
+    rnd = random.Random(42)
+    fonte = [DEFAULT_HEADER[:]]
+    for i in range(linhas):
+        fonte.append([f"P{i:06d}", f"{rnd.randint(0, 99999)},{rnd.randint(0, 99):02d}",
+                      rnd.choice(["Em obra", "Projeto", "Concluído"]), "", f"U{rnd.randrange(unidades):03d} "])
+    return fonte
+
+def medir(linhas: int, destinos: int):
+    unidades = max(1, destinos // 2)  # metade dos destinos repete filtro (mesmo BH → vários BI)
+    fonte = gerar_fonte(linhas, unidades)
+    filtros = [f"U{i % unidades:03d}" for i in range(destinos)]
+
+    t0 = time.perf_counter()
+    antigo = [filtrar_por_col_E(fonte, f) for f in filtros]
+    t_antigo = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    indice = indexar_por_col_E(fonte)
+    novo = [fatia_do_indice(indice, f) for f in filtros]
+    t_novo = time.perf_counter() - t0
+
+    assert antigo == novo, "índice divergiu do filtro original"
+    print(f"{linhas:>7} linhas × {destinos:>4} destinos | varredura: {t_antigo:8.3f}s | índice: {t_novo:7.3f}s | "
+          f"{t_antigo / max(t_novo, 1e-9):6.1f}×")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        medir(int(sys.argv[1]), int(sys.argv[2]))
+    else:
+        for linhas, destinos in [(10_000, 50), (10_000, 200), (50_000, 200), (50_000, 500)]:
+            medir(linhas, destinos)
@@ -0,0 +1,89 @@
+"""
+Partida a frio: tempo do início do processo até a primeira requisição pronta para sair.
+
+Cada medição roda num processo Python novo (imports e discovery sem cache em memória), sem
+rede: as credenciais são anônimas e as requisições são só montadas, não executadas. Compara
+o build() padrão do googleapiclient (SHEETS_DISCOVERY_ENXUTO=0, como os scripts faziam antes)
+com os clientes de sheets_comum.construir_servico.
+
+Etapas medidas no processo filho:
+  import       importar pipeline_bd_esteira (exportar + replicar + sheets_comum)
+  1ª requisição  Drive files.get (detecção de mudanças) montada
+  serviço      cliente do Sheets + spreadsheets.get e values.batchGet montados
+  threads      N clientes novos (um por thread de leitura/escrita/destino) com 1 requisição cada
+  por chamada  service.spreadsheets().values()… repetido, como a replicação faz a cada requisição
+
+Uso:
+  python benchmarks/bench_partida.py
+  python benchmarks/bench_partida.py --repeticoes 7 --threads 8 --chamadas 400
+"""
+import os, sys, json, time, argparse, statistics, subprocess
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+def filho(threads: int, chamadas: int):
+    t0 = time.perf_counter()
+    sys.path.insert(0, RAIZ)
+    import pipeline_bd_esteira  # noqa: F401 (o custo de import é parte da medição)
+    import exportar_esteira_carteira as exportar
+    import replicar_bd_esteira as replicar
+    from google.auth.credentials import AnonymousCredentials
+    t_import = time.perf_counter()
+
+    creds = AnonymousCredentials()
+    exportar.novo_drive(creds).files().get(fileId=exportar.ORIGEM_ID, fields="modifiedTime,version")
+    t_primeira = time.perf_counter()
+
+    service = replicar.novo_servico(creds)
+    service.spreadsheets().get(spreadsheetId=replicar.ORIGEM_ID, fields=replicar.META_FIELDS)
+    service.spreadsheets().values().batchGet(spreadsheetId=replicar.ORIGEM_ID, ranges=["Config!BH3:BH", "Config!BI3:BI"])
+    t_servico = time.perf_counter()
+
+    for _ in range(threads):
+        replicar.novo_servico(creds).spreadsheets().values().batchUpdate(
+            spreadsheetId="destino", body={"valueInputOption": "USER_ENTERED", "data": []})
+    t_threads = time.perf_counter()
+
+    for i in range(chamadas):
+        service.spreadsheets().values().get(spreadsheetId="destino", range=f"BD_Esteira!A{i+1}:E")
+    t_chamadas = time.perf_counter()
+
+    print(json.dumps({
+        "import": t_import - t0,
+        "primeira": t_primeira - t0,
+        "servico": t_servico - t_primeira,
+        "threads": t_threads - t_servico,
+        "por_chamada_ms": (t_chamadas - t_threads) / max(1, chamadas) * 1000,
+    }))
+
+def medir(enxuto: bool, args) -> dict:
+    env = {**os.environ, "SHEETS_DISCOVERY_ENXUTO": "1" if enxuto else "0"}
+    cmd = [sys.executable, os.path.abspath(__file__), "--filho",
+           "--threads", str(args.threads), "--chamadas", str(args.chamadas)]
+    amostras = []
+    for _ in range(args.repeticoes):
+        t0 = time.perf_counter()
+        saida = subprocess.run(cmd, env=env, check=True, capture_output=True, text=True).stdout
+        wall = time.perf_counter() - t0
+        amostras.append({**json.loads(saida.strip().splitlines()[-1]), "processo": wall})
+    return {k: statistics.median(a[k] for a in amostras) for k in amostras[0]}
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--repeticoes", type=int, default=5, help="processos por modo (mediana)")
+    ap.add_argument("--threads", type=int, default=6, help="clientes extras, um por thread")
+    ap.add_argument("--chamadas", type=int, default=200, help="requisições montadas no mesmo serviço")
+    ap.add_argument("--filho", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.filho:
+        filho(args.threads, args.chamadas)
+        return
+
+    print(f"{'modo':<22} {'import':>8} {'1ª req':>8} {'serviço':>8} {'threads':>8} {'ms/cham':>8} {'processo':>9}")
+    for nome, enxuto in (("build() padrão", False), ("discovery enxuto", True)):
+        r = medir(enxuto, args)
+        print(f"{nome:<22} {r['import']:>7.3f}s {r['primeira']:>7.3f}s {r['servico']:>7.3f}s "
+              f"{r['threads']:>7.3f}s {r['por_chamada_ms']:>8.2f} {r['processo']:>8.3f}s", flush=True)
+
+if __name__ == "__main__":
+    main()
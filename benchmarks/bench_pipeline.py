@@ -0,0 +1,164 @@
+"""
+Benchmark offline do pipeline (exportar → replicar) contra o Sheets falso de fake_sheets.py.
+
+Roda exportar_esteira_carteira.main e replicar_bd_esteira.main de ponta a ponta, sem rede e
+sem gastar cota, e reporta tempo, requisições, bytes trafegados e pico de memória.
+
+Uso:
+  python benchmarks/bench_pipeline.py --linhas 20000 --destinos 50
+  python benchmarks/bench_pipeline.py --linhas 5000 10000 --destinos 20 100 --latencia 0.05 --erro 0.02
+  python benchmarks/bench_pipeline.py --etapa replicar --cota 300 --json resultados.json
+  python benchmarks/bench_pipeline.py --etapa exportar --linhas 60000 --fatias 1 2 4
+"""
+import os, sys, json, time, random, tempfile, argparse, tracemalloc, contextlib, io, atexit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import sheets_comum
+import estado_esteira
+import exportar_esteira_carteira as exportar
+import replicar_bd_esteira as replicar
+import pipeline_bd_esteira as pipeline
+from fake_sheets import FakeSheets
+
+def montar_cenario(fake: FakeSheets, linhas: int, destinos: int, seed: int = 0, fatias: int = 1):
+    """
+    BD_Carteira com 'linhas' projetos, BD_Esteira vazia e Config!BH/BI com 'destinos' destinos.
+    Com fatias > 1, a carteira é dividida em planilhas origem-k (cada uma com cabeçalho); devolve ORIGENS.
+    """
+    rnd = random.Random(seed)
+    unidades = [f"Unidade {i:03d}" for i in range(max(1, destinos // 2 or 1))]
+    carteira = fake.aba(exportar.ORIGEM_ID, exportar.ABA_ORIGEM)
+    cab = [""] * 29
+    cab[0], cab[23], cab[25], cab[27], cab[28] = "Projeto", "Valor Recebido", "Status Esteira", "Valor Considerado", "Unidade"
+    carteira.append(cab)
+    for i in range(linhas):
+        r = [f"texto {j}" if rnd.random() < 0.3 else "" for j in range(29)]
+        r[0]  = f"PRJ-{i:07d}"
+        r[23] = round(rnd.uniform(0, 500_000), 2)
+        r[25] = rnd.choice(["Em obra", "Projeto", "Concluído", "Cancelado"])
+        r[27] = round(rnd.uniform(0, 500_000), 2)
+        r[28] = rnd.choice(unidades)
+        carteira.append(r)
+
+    fake.aba(exportar.DESTINO_ID, exportar.ABA_DESTINO)
+    config = fake.aba(replicar.ORIGEM_ID, replicar.CONFIG_CANDIDATAS[0])
+    ifiltro = sheets_comum.col_letter_to_index(replicar.COL_FILTRO) - 1
+    idest   = sheets_comum.col_letter_to_index(replicar.COL_DESTID) - 1
+    config.extend([[] for _ in range(replicar.START_ROW - 1)])
+    for d in range(destinos):
+        r = [""] * (idest + 1)
+        r[ifiltro], r[idest] = unidades[d % len(unidades)], f"destino-{d:04d}"
+        config.append(r)
+        fake.aba(f"destino-{d:04d}", replicar.ABA_DESTINO).extend([["antigo"] * 5 for _ in range(20)])
+
+    if fatias <= 1:
+        return []
+    tamanho = -(-linhas // fatias)
+    for k in range(fatias):
+        fake.aba(f"origem-{k}", exportar.ABA_ORIGEM).extend([cab] + carteira[1 + k * tamanho:1 + (k + 1) * tamanho])
+    return [{"planilha": f"origem-{k}", "aba": exportar.ABA_ORIGEM} for k in range(fatias)]
+
+def conectar(fake: FakeSheets, cota_cliente: int, creds=None):
+    """
+    Troca credenciais e construção de serviços dos scripts pelo Sheets falso. Com 'creds' (qualquer
+    objeto), os scripts seguem os caminhos de uma execução real: leituras/escritas paralelas, um serviço por thread.
+    """
+    for mod in (exportar, replicar):
+        mod.get_credentials = lambda: creds
+        mod.novo_drive = lambda creds: fake.drive()
+    exportar.novo_api = lambda creds: fake.servico().spreadsheets()
+    replicar.novo_servico = lambda creds: fake.servico()
+    # clientes por thread (sheets_comum.cliente_da_thread): o cache é por credencial, e cada cenário usa outra
+    sheets_comum.novo_cliente = lambda creds, api="sheets", versao="v4", timeout=None: \
+        fake.drive() if api == "drive" else fake.servico()
+    replicar.invalidar_metadados()
+
+    # limitador de cota do cliente (0 = sem limite) e orçamento de retries zerados a cada cenário
+    sheets_comum.REQ_POR_MINUTO = cota_cliente or 10**9
+    sheets_comum.RAJADA_MAX = max(1, sheets_comum.REQ_POR_MINUTO // 10)
+    sheets_comum.reiniciar_cota()
+    sheets_comum.reiniciar_orcamento()
+    sheets_comum.METRICAS_ARQUIVO = ""   # métricas ficam só no resultado do benchmark
+
+def rodar(etapa: str, args, linhas: int, destinos: int, fatias: int = 1) -> dict:
+    fake = FakeSheets(latencia=args.latencia, banda_bytes_s=args.banda, taxa_erro=args.erro,
+                      cota_por_minuto=args.cota_servidor, seed=args.seed)
+    exportar.ORIGENS = montar_cenario(fake, linhas, destinos, args.seed, fatias)
+    # com --fatias, credenciais falsas em todos os cenários: leitura das fatias em paralelo, como numa execução real
+    conectar(fake, args.cota, object() if args.fatias != [1] else None)
+    estado_esteira.ESTADO_DIR = tempfile.mkdtemp(prefix="bench-estado-")
+
+    alvo = {"exportar": exportar.main, "replicar": replicar.main, "pipeline": pipeline.main}[etapa]
+    if etapa == "replicar":
+        # a replicação parte de uma BD_Esteira já preenchida
+        with contextlib.redirect_stdout(io.StringIO()):
+            exportar.main()
+        fake.stats["requisicoes"].clear()
+        fake.stats.update(bytes_enviados=0, bytes_recebidos=0, erros_injetados=0, cota_excedida=0)
+
+    sheets_comum.reiniciar_metricas()
+    saida = io.StringIO() if not args.verbose else sys.stdout
+    if not args.sem_memoria:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(saida):
+        alvo()
+    wall = time.perf_counter() - t0
+    pico = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+    tracemalloc.stop()
+    metricas = sheets_comum.resumo_metricas()
+
+    return {
+        "etapa": etapa, "linhas": linhas, "destinos": destinos, "fatias": fatias,
+        "tempo_s": round(wall, 3),
+        "requisicoes": sum(fake.stats["requisicoes"].values()),
+        "por_operacao": dict(fake.stats["requisicoes"]),
+        "bytes_enviados": fake.stats["bytes_enviados"],
+        "bytes_recebidos": fake.stats["bytes_recebidos"],
+        "erros_injetados": fake.stats["erros_injetados"],
+        "cota_excedida": fake.stats["cota_excedida"],
+        "pico_memoria_mb": round(pico / 2**20, 1),
+        "etapas": {k: v["duracao_s"] for k, v in metricas["etapas"].items()},
+        "operacoes": metricas["operacoes"],
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--etapa", choices=["exportar", "replicar", "pipeline"], default="pipeline")
+    ap.add_argument("--linhas", type=int, nargs="+", default=[5000, 20000])
+    ap.add_argument("--destinos", type=int, nargs="+", default=[20])
+    ap.add_argument("--fatias", type=int, nargs="+", default=[1], help="origem dividida em N planilhas (ORIGENS)")
+    ap.add_argument("--latencia", type=float, default=0.02, help="latência base por requisição (s)")
+    ap.add_argument("--banda", type=float, default=20e6, help="bytes/s (0 = infinita)")
+    ap.add_argument("--erro", type=float, default=0.0, help="probabilidade de 503/429 injetado")
+    ap.add_argument("--cota-servidor", type=int, default=0, help="requisições/min aceitas pelo falso (0 = sem limite)")
+    ap.add_argument("--cota", type=int, default=0, help="SHEETS_REQ_POR_MINUTO do cliente, por balde de leitura/escrita (0 = sem limite)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="grava os resultados neste arquivo (para comparar execuções)")
+    ap.add_argument("--sem-memoria", action="store_true",
+                    help="não mede o pico de memória (tracemalloc deixa o Python ~3× mais lento)")
+    ap.add_argument("-v", "--verbose", action="store_true", help="mostra o log dos scripts")
+    args = ap.parse_args()
+
+    resultados = []
+    print(f"{'etapa':<9} {'linhas':>7} {'dest':>5} {'fatias':>6} {'tempo':>8} {'reqs':>6} {'MB env':>7} {'MB rec':>7} "
+          f"{'erros':>5} {'pico MB':>8}")
+    for linhas in args.linhas:
+        for destinos in args.destinos:
+            for fatias in args.fatias:
+                r = rodar(args.etapa, args, linhas, destinos, fatias)
+                resultados.append(r)
+                print(f"{r['etapa']:<9} {linhas:>7} {destinos:>5} {fatias:>6} {r['tempo_s']:>7.2f}s {r['requisicoes']:>6} "
+                      f"{r['bytes_enviados']/2**20:>7.2f} {r['bytes_recebidos']/2**20:>7.2f} "
+                      f"{r['erros_injetados']:>5} {r['pico_memoria_mb']:>8.1f}", flush=True)
+                if args.verbose:
+                    print("   etapas: " + ", ".join(f"{k} {v:.2f}s" for k, v in r["etapas"].items()))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=1)
+    atexit.unregister(sheets_comum.emitir_metricas)  # nada de resumo do benchmark no $GITHUB_STEP_SUMMARY
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""
+Stand-in local da API do Sheets v4 (e do files.get do Drive v3) para benchmarks offline.
+
+Imita a cadeia de recursos do googleapiclient usada pelos scripts:
+  service.spreadsheets().get / batchUpdate
+  service.spreadsheets().values().get / batchGet / update / batchUpdate / clear / batchClear
+  drive.files().get
+
+Cada execute() passa por: cota por minuto (429 + Retry-After), erro injetado (503/429),
+latência base + atraso proporcional aos bytes (requisição + resposta). Tudo é contabilizado
+em FakeSheets.stats (requisições por operação, bytes, erros).
+"""
+import json, random, re, threading, time, collections, urllib.parse
+from typing import Dict, List, Optional
+
+from googleapiclient.errors import HttpError
+
+_a1 = re.compile(r"^([A-Z]*)(\d*)(?::([A-Z]*)(\d*))?$")
+_num_br = re.compile(r"^\s*(?:R\$\s*)?(-?)(\d{1,3}(?:\.\d{3})+|\d+)(?:,(\d+))?\s*$")
+
+def _col(letras: str) -> int:
+    n = 0
+    for ch in letras:
+        n = n * 26 + ord(ch) - 64
+    return n
+
+def _intervalo(rng: str):
+    """'Aba!A2:E10' → (aba, col0, lin0, col1, lin1) 0-based, fim exclusivo (None = até o fim)."""
+    aba, _, a1 = rng.partition("!")
+    m = _a1.match(a1)
+    if not m:
+        raise ValueError(f"intervalo inválido: {rng}")
+    c0, r0, c1, r1 = m.groups()
+    if m.group(3) is None:          # célula única ou coluna única
+        c1, r1 = c0, r0
+    col0 = _col(c0) - 1 if c0 else 0
+    col1 = _col(c1) if c1 else None
+    lin0 = int(r0) - 1 if r0 else 0
+    lin1 = int(r1) if r1 else None
+    return aba, col0, lin0, col1, lin1
+
+def _user_entered(v):
+    """Como o Sheets interpreta USER_ENTERED: texto numérico pt-BR vira número."""
+    if isinstance(v, str):
+        m = _num_br.match(v)
+        if m:
+            sinal, inteiro, frac = m.groups()
+            return float(f"{sinal}{inteiro.replace('.', '')}.{frac or '0'}")
+    return v
+
+def _formatado(v):
+    if isinstance(v, bool):
+        return "TRUE" if v else "FALSE"
+    if isinstance(v, (int, float)):
+        inteiro, frac = f"{abs(v):,.2f}".split(".")
+        return ("-" if v < 0 else "") + inteiro.replace(",", ".") + "," + frac
+    return v
+
+def _tamanho(obj) -> int:
+    return len(json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8"))
+
+class _Resposta(dict):
+    """Imita httplib2.Response (dict de cabeçalhos + .status/.reason)."""
+    def __init__(self, status: int, cabecalhos: Optional[dict] = None):
+        super().__init__(cabecalhos or {})
+        self["status"] = str(status)
+        self.status = status
+        self.reason = "fake"
+
+class FakeSheets:
+    """'Servidor' compartilhado: planilhas em memória + modelo de rede + estatísticas."""
+
+    def __init__(self, latencia: float = 0.0, banda_bytes_s: float = 0.0, taxa_erro: float = 0.0,
+                 cota_por_minuto: int = 0, seed: int = 0):
+        self.planilhas: Dict[str, Dict[str, List[List]]] = {}
+        self.versoes: Dict[str, int] = collections.defaultdict(int)
+        self.latencia = latencia
+        self.banda = banda_bytes_s
+        self.taxa_erro = taxa_erro
+        self.cota = cota_por_minuto
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self._janela = collections.deque()
+        self.stats = {"requisicoes": collections.Counter(), "bytes_enviados": 0, "bytes_recebidos": 0,
+                      "erros_injetados": 0, "cota_excedida": 0}
+
+    # ---------- dados ----------
+    def aba(self, planilha: str, aba: str) -> List[List]:
+        return self.planilhas.setdefault(planilha, {}).setdefault(aba, [])
+
+    def valores(self, planilha: str, aba: str) -> List[List]:
+        """Conteúdo não-vazio da aba (sem células vazias à direita), para conferência."""
+        linhas = [list(r) for r in self.aba(planilha, aba)]
+        for r in linhas:
+            while r and r[-1] == "":
+                r.pop()
+        while linhas and not linhas[-1]:
+            linhas.pop()
+        return linhas
+
+    # ---------- clientes ----------
+    def servico(self):
+        """Equivalente a build("sheets", "v4", http=…)."""
+        return _Servico(self)
+
+    def drive(self):
+        """Equivalente a build("drive", "v3", http=…)."""
+        return _Drive(self)
+
+    # ---------- rede simulada ----------
+    def _executar(self, op: str, corpo, fn):
+        enviado = _tamanho(corpo) if corpo is not None else 0
+        with self._lock:
+            self.stats["requisicoes"][op] += 1
+            self.stats["bytes_enviados"] += enviado
+            agora = time.monotonic()
+            while self._janela and agora - self._janela[0] > 60:
+                self._janela.popleft()
+            excedeu = bool(self.cota) and len(self._janela) >= self.cota
+            if excedeu:
+                self.stats["cota_excedida"] += 1
+                espera = max(1, int(60 - (agora - self._janela[0])) + 1)
+            else:
+                self._janela.append(agora)
+            injetar = not excedeu and self.taxa_erro and self._rnd.random() < self.taxa_erro
+            status = self._rnd.choice([503, 503, 429]) if injetar else None
+            if injetar:
+                self.stats["erros_injetados"] += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+        if excedeu:
+            raise HttpError(_Resposta(429, {"retry-after": str(espera)}), b'{"error": {"message": "Quota exceeded", "status": "RESOURCE_EXHAUSTED"}}')
+        if status:
+            raise HttpError(_Resposta(status), b'{"error": {"message": "The service is currently unavailable.", "status": "UNAVAILABLE"}}')
+        with self._lock:
+            resposta = fn()
+        recebido = _tamanho(resposta)
+        with self._lock:
+            self.stats["bytes_recebidos"] += recebido
+        if self.banda:
+            time.sleep((enviado + recebido) / self.banda)
+        return resposta
+
+    def _ler(self, planilha: str, rng: str, dimensao: str = "ROWS", render: str = "FORMATTED_VALUE"):
+        aba, c0, r0, c1, r1 = _intervalo(rng)
+        grade = self.aba(planilha, aba)
+        linhas = []
+        for r in grade[r0:r1]:
+            linha = list(r[c0:c1])
+            if render == "FORMATTED_VALUE":
+                linha = [_formatado(v) for v in linha]
+            while linha and linha[-1] == "":
+                linha.pop()
+            linhas.append(linha)
+        while linhas and not linhas[-1]:
+            linhas.pop()
+        if dimensao == "COLUMNS":
+            largura = max((len(r) for r in linhas), default=0)
+            linhas = [[r[j] if j < len(r) else "" for r in linhas] for j in range(largura)]
+            for c in linhas:
+                while c and c[-1] == "":
+                    c.pop()
+        saida = {"range": rng, "majorDimension": dimensao}
+        if linhas:
+            saida["values"] = linhas
+        return saida
+
+    def _escrever(self, planilha: str, rng: str, valores: List[List]):
+        aba, c0, r0, _, _ = _intervalo(rng)
+        grade = self.aba(planilha, aba)
+        for i, linha in enumerate(valores):
+            while len(grade) <= r0 + i:
+                grade.append([])
+            r = grade[r0 + i]
+            while len(r) < c0 + len(linha):
+                r.append("")
+            for j, v in enumerate(linha):
+                r[c0 + j] = _user_entered(v)
+        self.versoes[planilha] += 1
+
+    def _limpar(self, planilha: str, rng: str):
+        aba, c0, r0, c1, r1 = _intervalo(rng)
+        grade = self.aba(planilha, aba)
+        for r in grade[r0:r1]:
+            for j in range(c0, len(r) if c1 is None else min(c1, len(r))):
+                r[j] = ""
+        self.versoes[planilha] += 1
+
+    def _deslocar(self, grade: List[List], rng: dict, inserir: bool):
+        """insertRange/deleteRange com shiftDimension=ROWS: só as colunas do intervalo se movem."""
+        r0, r1 = rng.get("startRowIndex", 0), rng["endRowIndex"]
+        c0, c1 = rng.get("startColumnIndex", 0), rng["endColumnIndex"]
+        n = r1 - r0
+        while len(grade) < (r0 if inserir else r1):
+            grade.append([])
+        colunas = [[(r[c] if c < len(r) else "") for r in grade] for c in range(c0, c1)]
+        for col in colunas:
+            if inserir:
+                col[r0:r0] = [""] * n
+            else:
+                del col[r0:r1]
+                col.extend([""] * n)
+        while len(grade) < len(colunas[0]):
+            grade.append([])
+        for i, r in enumerate(grade):
+            while len(r) < c1:
+                r.append("")
+            for k, col in enumerate(colunas):
+                r[c0 + k] = col[i] if i < len(col) else ""
+
+    def _metadados(self, planilha: str):
+        abas = []
+        for i, (titulo, grade) in enumerate(self.planilhas.get(planilha, {}).items()):
+            abas.append({"properties": {"sheetId": i, "title": titulo, "gridProperties": {
+                "rowCount": max(1000, len(grade)),
+                "columnCount": max(26, max((len(r) for r in grade), default=0))}}})
+        return {"spreadsheetId": planilha, "sheets": abas}
+
+def _uri(planilha: str, caminho: str = "", api: str = "sheets", **query) -> str:
+    """URI no formato do googleapiclient (path params com %-encoding, 'ranges' repetido)."""
+    base = ("https://sheets.googleapis.com/v4/spreadsheets/" if api == "sheets"
+            else "https://www.googleapis.com/drive/v3/files/")
+    return base + urllib.parse.quote(planilha, safe="") + caminho + "?" + urllib.parse.urlencode(
+        {**query, "alt": "json"}, doseq=True)
+
+class _Requisicao:
+    """Imita googleapiclient.http.HttpRequest: methodId, uri, body (JSON) e execute()."""
+    def __init__(self, servidor: FakeSheets, op: str, corpo, fn, uri: str = ""):
+        self._servidor, self.methodId, self._corpo, self._fn, self.uri = servidor, op, corpo, fn, uri
+        self.body = json.dumps(corpo, ensure_ascii=False) if corpo is not None else None
+
+    def execute(self, num_retries: int = 0):
+        return self._servidor._executar(self.methodId, self._corpo, self._fn)
+
+class _Servico:
+    def __init__(self, servidor: FakeSheets):
+        self._s = servidor
+
+    def spreadsheets(self):
+        return _Planilhas(self._s)
+
+class _Planilhas:
+    def __init__(self, servidor: FakeSheets):
+        self._s = servidor
+
+    def values(self):
+        return _Valores(self._s)
+
+    def get(self, spreadsheetId: str, fields: str = None, **_):
+        return _Requisicao(self._s, "sheets.spreadsheets.get", None, lambda: self._s._metadados(spreadsheetId),
+                           _uri(spreadsheetId, fields=fields or ""))
+
+    def batchUpdate(self, spreadsheetId: str, body: dict):
+        def fn():
+            grades = list(self._s.planilhas.get(spreadsheetId, {}).values())
+            for req in body.get("requests", []):
+                props = req.get("updateSheetProperties", {}).get("properties", {})
+                if props.get("sheetId") is not None and props["sheetId"] < len(grades):
+                    grade = grades[props["sheetId"]]
+                    while len(grade) < props.get("gridProperties", {}).get("rowCount", 0):
+                        grade.append([])
+                for tipo in ("insertRange", "deleteRange"):
+                    if tipo in req:
+                        self._s._deslocar(grades[req[tipo]["range"]["sheetId"]], req[tipo]["range"], tipo == "insertRange")
+            if body.get("requests"):
+                self._s.versoes[spreadsheetId] += 1
+            return {"spreadsheetId": spreadsheetId, "replies": [{} for _ in body.get("requests", [])]}
+        return _Requisicao(self._s, "sheets.spreadsheets.batchUpdate", body, fn, _uri(spreadsheetId, ":batchUpdate"))
+
+class _Valores:
+    def __init__(self, servidor: FakeSheets):
+        self._s = servidor
+
+    def get(self, spreadsheetId: str, range: str, majorDimension: str = "ROWS",
+            valueRenderOption: str = "FORMATTED_VALUE", **_):
+        return _Requisicao(self._s, "sheets.spreadsheets.values.get", None,
+                           lambda: self._s._ler(spreadsheetId, range, majorDimension, valueRenderOption),
+                           _uri(spreadsheetId, "/values/" + urllib.parse.quote(range, safe=""),
+                                majorDimension=majorDimension, valueRenderOption=valueRenderOption))
+
+    def batchGet(self, spreadsheetId: str, ranges: List[str], majorDimension: str = "ROWS",
+                 valueRenderOption: str = "FORMATTED_VALUE", **_):
+        return _Requisicao(self._s, "sheets.spreadsheets.values.batchGet", None, lambda: {
+            "spreadsheetId": spreadsheetId,
+            "valueRanges": [self._s._ler(spreadsheetId, r, majorDimension, valueRenderOption) for r in ranges]},
+            _uri(spreadsheetId, "/values:batchGet", ranges=ranges, majorDimension=majorDimension,
+                 valueRenderOption=valueRenderOption))
+
+    def update(self, spreadsheetId: str, range: str, body: dict, valueInputOption: str = "RAW", **_):
+        def fn():
+            self._s._escrever(spreadsheetId, range, body.get("values", []))
+            return {"spreadsheetId": spreadsheetId, "updatedRange": range}
+        return _Requisicao(self._s, "sheets.spreadsheets.values.update", body, fn,
+                           _uri(spreadsheetId, "/values/" + urllib.parse.quote(range, safe=""),
+                                valueInputOption=valueInputOption))
+
+    def batchUpdate(self, spreadsheetId: str, body: dict):
+        def fn():
+            for d in body.get("data", []):
+                self._s._escrever(spreadsheetId, d["range"], d.get("values", []))
+            return {"spreadsheetId": spreadsheetId, "totalUpdatedRanges": len(body.get("data", []))}
+        return _Requisicao(self._s, "sheets.spreadsheets.values.batchUpdate", body, fn,
+                           _uri(spreadsheetId, "/values:batchUpdate"))
+
+    def clear(self, spreadsheetId: str, range: str, body: dict = None):
+        def fn():
+            self._s._limpar(spreadsheetId, range)
+            return {"spreadsheetId": spreadsheetId, "clearedRange": range}
+        return _Requisicao(self._s, "sheets.spreadsheets.values.clear", None, fn,
+                           _uri(spreadsheetId, "/values/" + urllib.parse.quote(range, safe="") + ":clear"))
+
+    def batchClear(self, spreadsheetId: str, body: dict):
+        def fn():
+            for r in body.get("ranges", []):
+                self._s._limpar(spreadsheetId, r)
+            return {"spreadsheetId": spreadsheetId, "clearedRanges": body.get("ranges", [])}
+        return _Requisicao(self._s, "sheets.spreadsheets.values.batchClear", body, fn,
+                           _uri(spreadsheetId, "/values:batchClear"))
+
+class _Drive:
+    def __init__(self, servidor: FakeSheets):
+        self._s = servidor
+
+    def files(self):
+        return self
+
+    def get(self, fileId: str, fields: str = None, **_):
+        return _Requisicao(self._s, "drive.files.get", None, lambda: {
+            "modifiedTime": f"v{self._s.versoes[fileId]}", "version": str(self._s.versoes[fileId])},
+            _uri(fileId, api="drive", fields=fields or ""))
@@ -0,0 +1,131 @@
+import os, json, gzip, hashlib, tempfile, threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# ============== ESTADO LOCAL ENTRE EXECUÇÕES ==============
+# Versão das origens no Drive, hash/snapshot da BD_Esteira gerada e hash por destino.
+# No GitHub Actions o diretório é preservado entre execuções via actions/cache.
+ESTADO_DIR = os.getenv("BD_ESTEIRA_ESTADO", ".estado")
+FORCAR     = os.getenv("BD_ESTEIRA_FORCAR", "") not in ("", "0", "false", "False")  # ignora o estado salvo
+
+def _caminho(nome: str) -> str:
+    return os.path.join(ESTADO_DIR, nome)
+
+def _gravar_atomico(nome: str, dados: bytes):
+    os.makedirs(ESTADO_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=ESTADO_DIR, prefix=f".{nome}.")
+    with os.fdopen(fd, "wb") as f:
+        f.write(dados)
+    os.replace(tmp, _caminho(nome))
+
+def carregar_json(nome: str) -> dict:
+    try:
+        with open(_caminho(nome), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def salvar_json(nome: str, dados: dict):
+    _gravar_atomico(nome, json.dumps(dados, ensure_ascii=False, indent=1).encode("utf-8"))
+
+def hash_linhas(linhas: List[List]) -> str:
+    """Hash de conteúdo estável (ordem e tipos das células contam)."""
+    h = hashlib.sha256()
+    for r in linhas:
+        h.update(json.dumps(r, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+# ============== SNAPSHOT COLUNAR DA BD_ESTEIRA ==============
+SNAPSHOT = "esteira_snapshot.json.gz"
+
+def salvar_snapshot(linhas: List[List], largura: int = 5, **extra):
+    """Grava a tabela em formato colunar comprimido (gzip), com o hash do conteúdo."""
+    colunas = [[(r[j] if j < len(r) else "") for r in linhas] for j in range(largura)]
+    dados = {"hash": hash_linhas(linhas), "linhas": len(linhas), "colunas": colunas, **extra}
+    _gravar_atomico(SNAPSHOT, gzip.compress(json.dumps(dados, ensure_ascii=False, separators=(",", ":")).encode("utf-8")))
+
+def carregar_snapshot() -> Optional[Dict]:
+    """{"hash", "linhas", "colunas", …} ou None se não houver snapshot."""
+    try:
+        with open(_caminho(SNAPSHOT), "rb") as f:
+            return json.loads(gzip.decompress(f.read()).decode("utf-8"))
+    except (OSError, ValueError, EOFError):
+        return None
+
+def linhas_do_snapshot(snap: Dict) -> List[List]:
+    return [list(t) for t in zip(*snap.get("colunas", []))]
+
+# ============== VERSÃO NO DRIVE ==============
+def versao_drive(drive, file_id: str, retry) -> Optional[Dict[str, str]]:
+    """{"modifiedTime", "version"} do arquivo (chamada barata); None se o Drive não responder."""
+    try:
+        return retry(
+            drive.files().get(fileId=file_id, fields="modifiedTime,version", supportsAllDrives=True),
+            f"Ler versão no Drive de {file_id}"
+        )
+    except Exception:
+        return None
+
+# ============== DIÁRIO DE EXECUÇÃO (retomada) ==============
+# Gravado a cada lote e a cada destino concluído: se o processo morrer no meio (timeout do runner
+# depois de muitos backoffs), a execução seguinte refaz só o que faltou. Os destinos concluídos vão
+# para o estado normal no fim; no diário só ficam os que pararam pela metade.
+_diario_lock = threading.Lock()
+
+def abrir_diario(nome: str) -> Dict:
+    """
+    {"concluidos": {chave: hash}, "parciais": {chave: {"hash", "plano", "feitos"}}} da execução
+    anterior (vazio com FORCAR). plano/feitos: [[linha inicial 1-based, nº de linhas]].
+    """
+    d = {} if FORCAR else carregar_json(nome)
+    return {"concluidos": dict(d.get("concluidos", {})), "parciais": dict(d.get("parciais", {}))}
+
+def _salvar_diario(nome: str, diario: Dict):
+    try:
+        salvar_json(nome, diario)
+    except OSError:
+        pass  # sem diário a execução continua; só não dá para retomar
+
+def diario_parcial(diario: Dict, chave: str, h: str) -> Optional[Dict]:
+    """Progresso gravado de 'chave' se ele for do mesmo conteúdo (hash); senão None."""
+    with _diario_lock:
+        p = diario["parciais"].get(chave)
+        return json.loads(json.dumps(p)) if p and p.get("hash") == h else None
+
+def diario_plano(diario: Dict, nome: str, chave: str, h: str, plano: Sequence[Tuple[int, int]]):
+    """Registra o que falta gravar em 'chave' (recomeça os lotes feitos se o conteúdo mudou)."""
+    with _diario_lock:
+        p = diario["parciais"].get(chave)
+        if not p or p.get("hash") != h:
+            p = diario["parciais"][chave] = {"hash": h, "feitos": []}
+        p["plano"] = [list(x) for x in plano]
+        _salvar_diario(nome, diario)
+
+def diario_lote(diario: Dict, nome: str, chave: str, h: str, feitos: Sequence[Tuple[int, int]]):
+    """Anota intervalos de linhas já gravados em 'chave'."""
+    with _diario_lock:
+        p = diario["parciais"].get(chave)
+        if not p or p.get("hash") != h:
+            p = diario["parciais"][chave] = {"hash": h, "plano": None, "feitos": []}
+        p["feitos"].extend(list(x) for x in feitos)
+        _salvar_diario(nome, diario)
+
+def diario_concluido(diario: Dict, nome: str, chave: str, h: str):
+    with _diario_lock:
+        diario["parciais"].pop(chave, None)
+        diario["concluidos"][chave] = h
+        _salvar_diario(nome, diario)
+
+def encerrar_diario(nome: str, diario: Dict, ativos=()):
+    """Fim da execução (estado já salvo): mantém só os parciais de 'ativos'; sem eles, apaga o diário."""
+    with _diario_lock:
+        diario["concluidos"].clear()
+        for chave in [c for c in diario["parciais"] if c not in ativos]:
+            diario["parciais"].pop(chave)
+        if diario["parciais"]:
+            _salvar_diario(nome, diario)
+            return
+    try:
+        os.remove(_caminho(nome))
+    except OSError:
+        pass
@@ -1,9 +1,16 @@
-import time, datetime, random, re, math, os, json
-from typing import List
+import time, datetime, random, re, os, json, threading, functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import List, Optional, Tuple
 from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
-import google_auth_httplib2, httplib2
 from googleapiclient.errors import HttpError
+from sheets_comum import (planejar_escrita, gravar_lotes, linhas_do_lote, descontar_feitos, delta_por_chave, diferencas, requisicoes_legadas, registrar_economia, resumo_economia,
+                          novo_cliente, cliente_da_thread, renovar_token, executar, medir, etapa, cronometrar,
+                          aguardar_cota, retentavel, consumir_orcamento, retry_after, texto_local,
+                          col_letter_to_index, index_to_col_letter)
+from estado_esteira import (carregar_json, salvar_json, hash_linhas, versao_drive, FORCAR,
+                            carregar_snapshot, salvar_snapshot, linhas_do_snapshot,
+                            abrir_diario, diario_parcial, diario_plano, diario_lote, encerrar_diario)
 
 # === CONFIG ===
 ORIGEM_ID   = "1gDktQhF0WIjfAX76J2yxQqEeeBsSfMUPGs5svbf9xGM"
@@ -11,20 +18,67 @@ ABA_ORIGEM  = "BD_Carteira"
 DESTINO_ID  = "1T6HVLBQi21CIeS64tAjI314TYi2795COOCAakzLV-q0"
 ABA_DESTINO = "BD_Esteira"
 
+# Origem fatiada (ex.: uma planilha/aba por regional): as fatias são lidas em paralelo e juntadas na
+# ordem da lista. Cada item: {"planilha": ID, "aba": "BD_Carteira", "linhas": "1:40000" (opcional),
+# "cabecalho": bool (opcional: a 1ª linha do intervalo é cabeçalho; só o da 1ª fatia fica). Por padrão,
+# só intervalos que começam na linha 1 da aba têm cabeçalho ("linhas": "52:101" não descarta a linha 52)}.
+# Vazia = só ORIGEM_ID/ABA_ORIGEM. Também pode vir em JSON no ambiente (BD_ESTEIRA_ORIGENS).
+ORIGENS = json.loads(os.getenv("BD_ESTEIRA_ORIGENS", "") or "[]")
+ORIGENS_PARALELAS = 4          # fatias lidas ao mesmo tempo
+DEDUP_PROJETO     = False      # com fatias: Projeto (coluna A) repetido fica só na 1ª ocorrência
+
 # CRED_FILE local só será usado se NÃO existir GOOGLE_CREDENTIALS no ambiente
 CRED_FILE   = "credenciais.json"
 
-WRITE_CHUNK   = 1200           # linhas por escrita no destino
-INIT_READ_ALL = True           # tenta 1 leitura total A:AC primeiro
+WRITE_CHUNK   = 1200           # referência do fluxo antigo (relatório de requisições economizadas)
+INIT_READ_ALL = True           # tenta 1 leitura total primeiro
 MAX_RETRIES   = 8
 BACKOFF_BASE  = 3.0
-HTTP_TIMEOUT  = 600
 SCOPES = ["https://www.googleapis.com/auth/spreadsheets",
           "https://www.googleapis.com/auth/drive"]
 
+# Projeção BD_Carteira → BD_Esteira: (coluna origem, coluna destino, numérica?)
+# Define tanto o que é lido quanto a transformação (ordem = colunas A..E do destino).
+PROJECAO = [
+    ("A",  "A", False),   # Projeto
+    ("AB", "B", True),    # Valor Considerado
+    ("Z",  "C", False),   # Status Esteira
+    ("X",  "D", True),    # Valor Recebido
+    ("AC", "E", False),   # Unidade (vai como está)
+]
+LEITURA_PROJETADA = True       # batchGet só das colunas da PROJECAO (em vez de A:AC)
+# Leitura tipada (UNFORMATTED_VALUE): números chegam como número, sem passar por clean_number_br.
+# A saída muda em relação à leitura do texto exibido (padrão): sem o arredondamento da exibição,
+# percentuais como fração (10% → 0.1) e valores muito pequenos/grandes como número (o texto
+# "1,00E-05" vira ""). Nas colunas de texto, números e booleanos são escritos localmente
+# (123 → "123", 1.5 → "1,5", TRUE) e datas chegam como número serial.
+LEITURA_TIPADA    = False
+
 # Leitura segmentada (quando all-in-one falha)
 SEG_INIT = 2000                # tamanho inicial do bloco de leitura
 SEG_MIN  = 200                 # não baixar abaixo disso
+SEG_MAX  = 4000                # teto do bloco
+SEG_PASSO = 200                # aumento aditivo por bloco lido com sucesso
+
+# Leitura segmentada paralela (AIMD: +1 conexão por rodada ok, metade em 429/5xx)
+LEITURA_PARALELA = True
+PAR_INIT   = 2                 # leituras simultâneas no início
+PAR_MAX    = 6                 # teto de leituras simultâneas
+
+# Detecção de mudanças: versão da origem no Drive + hash do conteúdo projetado x snapshot local
+DETECTAR_MUDANCAS = True
+ESTADO_EXPORTAR   = "exportar.json"
+DIARIO_EXPORTAR   = "exportar_diario.json"  # plano e lotes já gravados da escrita em curso (retomada após queda)
+
+# Números pt-BR: cache de valores repetidos (muito comuns na Carteira)
+NUM_CACHE_MAX  = 65536
+
+# Delta por chave (coluna A = Projeto): em vez de regravar a tabela, compara com o conteúdo atual
+# (snapshot local, se o destino não mudou desde a última escrita; senão lê A:E), desloca as células
+# A:E nas inserções/remoções do meio e grava só as linhas novas/alteradas
+MODO_DELTA = True
+DELTA_MAX_DESLOCAMENTOS = 500  # mais trechos que isso (ou se não compensar): diff posicional
+DELTA_ECONOMIA_MIN = 0.5       # deslocar só se poupar ao menos essa fração das linhas do diff posicional
 
 def log(msg: str) -> None:
     # Log sempre em horário de Brasília (UTC-3)
@@ -32,14 +86,8 @@ def log(msg: str) -> None:
     print(f"[{br_now.strftime('%H:%M:%S')}] {msg}", flush=True)
 
 def retry(fn, desc):
-    for att in range(1, MAX_RETRIES+1):
-        try:
-            return fn()
-        except Exception as e:
-            wait = min(90, BACKOFF_BASE*(2**(att-1)) + random.uniform(0,1.5))
-            log(f"⚠️ {desc} — tentativa {att}/{MAX_RETRIES} falhou: {e} | aguardando {round(wait,1)}s")
-            time.sleep(wait)
-    raise RuntimeError(f"❌ {desc} — falhou após {MAX_RETRIES} tentativas.")
+    """Camada comum (sheets_comum.executar): cota global, erros fatais sem retry, Retry-After e orçamento."""
+    return executar(fn, desc, log, tentativas=MAX_RETRIES, backoff=BACKOFF_BASE)
 
 _num_re = re.compile(r"[^\d,.\-]")
 def clean_number_br(v):
@@ -54,6 +102,46 @@ def clean_number_br(v):
     except:
         return ""
 
+@functools.lru_cache(maxsize=NUM_CACHE_MAX)
+def _clean_number_br_str(v: str):
+    # só strings entram no cache: 0.0/-0.0 e 1/True colidiriam como chave
+    return clean_number_br(v)
+
+_np_pd = None
+def _numpy_pandas():
+    """numpy/pandas são carregados só na primeira coluna convertida (e são opcionais)."""
+    global _np_pd
+    if _np_pd is None:
+        try:
+            import numpy, pandas
+            _np_pd = (numpy, pandas)
+        except ImportError:
+            _np_pd = False
+    return _np_pd
+
+def clean_column_br(valores: List) -> List:
+    """
+    Converte uma coluna inteira com o mesmo resultado de clean_number_br, valor a valor (textos).
+    Com pandas: factorize (valores distintos + códigos) → converte só os distintos
+    (via cache) → take vetorizado de volta. Sem pandas: mesmo cache, em Python puro.
+    """
+    if not valores:
+        return []
+    valores = ["" if v is None else v for v in valores]  # clean_number_br(None) == clean_number_br("")
+    if not all(type(v) is str for v in valores):
+        # leitura tipada: números passam direto (float), sem clean_number_br — que, sobre o texto
+        # exibido, daria outro resultado em vários casos (ver LEITURA_TIPADA)
+        return [float(v) if type(v) in (int, float) else
+                _clean_number_br_str(v) if type(v) is str else clean_number_br(v) for v in valores]
+    libs = _numpy_pandas()
+    if not libs:
+        return [_clean_number_br_str(v) for v in valores]
+    np, pd = libs
+    codigos, distintos = pd.factorize(np.asarray(valores, dtype=object))
+    convertidos = np.empty(len(distintos), dtype=object)
+    convertidos[:] = [_clean_number_br_str(u) for u in distintos]
+    return convertidos.take(codigos).tolist()
+
 def get_credentials():
     """
     1º tenta pegar o JSON completo do segredo GOOGLE_CREDENTIALS (GitHub Actions).
@@ -67,149 +155,562 @@ def get_credentials():
     log("🔑 Usando credenciais do arquivo local (credenciais.json).")
     return Credentials.from_service_account_file(CRED_FILE, scopes=SCOPES)
 
+def novo_api(creds):
+    """Recurso spreadsheets() com conexão persistente própria (um por thread)."""
+    return novo_cliente(creds).spreadsheets()
+
+def api_da_thread(creds):
+    """Recurso spreadsheets() sobre o cliente da thread atual (sheets_comum.cliente_da_thread)."""
+    return cliente_da_thread(creds).spreadsheets()
+
+def novo_drive(creds):
+    """Serviço do Drive (só para ler modifiedTime/version da origem)."""
+    return novo_cliente(creds, "drive", "v3")
+
 def get_services():
-    creds = get_credentials()
-    http  = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
-    api   = build("sheets","v4", http=http).spreadsheets()
-    return api
-
-def read_all_once(api):
-    """Tenta ler A:AC de uma vez só (rápido)."""
-    return api.values().get(
-        spreadsheetId=ORIGEM_ID,
-        range=f"{ABA_ORIGEM}!A:AC"   # inclui AC
-    ).execute()
-
-def count_rows_adaptive(api):
+    return novo_api(get_credentials())
+
+_IDX_ORIGEM = [col_letter_to_index(c) - 1 for c, _, _ in PROJECAO]
+_ULTIMA_COL = index_to_col_letter(max(_IDX_ORIGEM) + 1)
+
+def fatias_origem() -> List[Tuple[str, str, int, Optional[int], bool]]:
+    """Origens normalizadas: (planilha, aba, 1ª linha 0-based, fim exclusivo ou None, tem cabeçalho)."""
+    if not ORIGENS:
+        return [(ORIGEM_ID, ABA_ORIGEM, 0, None, True)]
+    fatias = []
+    for o in ORIGENS:
+        m = re.fullmatch(r"\s*(\d*)\s*:\s*(\d*)\s*", str(o.get("linhas") or ":"))
+        if not m:
+            raise ValueError(f"Intervalo de linhas inválido em ORIGENS: {o.get('linhas')!r}")
+        ini = int(m.group(1)) - 1 if m.group(1) else 0
+        fim = int(m.group(2)) if m.group(2) else None
+        fatias.append((o.get("planilha") or ORIGEM_ID, o.get("aba") or ABA_ORIGEM, ini, fim,
+                       bool(o.get("cabecalho", ini == 0))))
+    return fatias
+
+def _origem(origem=None):
+    return origem or (ORIGEM_ID, ABA_ORIGEM, 0, None, True)
+
+def versao_origem(drive) -> Optional[dict]:
+    """Versão da origem no Drive; com ORIGENS, a combinação das versões das planilhas das fatias."""
+    if not ORIGENS:
+        return versao_drive(drive, ORIGEM_ID, retry)
+    versoes = {p: versao_drive(drive, p, retry) for p in sorted({f[0] for f in fatias_origem()})}
+    if any(v is None for v in versoes.values()):
+        return None
+    return {"modifiedTime": max(v.get("modifiedTime", "") for v in versoes.values()),
+            "fatias": {p: v.get("version") for p, v in versoes.items()}, "origens": ORIGENS}
+
+def _faixas_leitura():
+    """Colunas da PROJECAO agrupadas em faixas contíguas: [(coluna inicial, coluna final)] (1-based)."""
+    faixas = []
+    for i in sorted({col_letter_to_index(c) for c, _, _ in PROJECAO}):
+        if faixas and i == faixas[-1][1] + 1:
+            faixas[-1][1] = i
+        else:
+            faixas.append([i, i])
+    return [(a, b) for a, b in faixas]
+
+def projetar_linhas(rows):
+    """Linhas A:AC completas → layout do destino (ordem da PROJECAO)."""
+    return [[r[i] if len(r) > i else "" for i in _IDX_ORIGEM] for r in rows]
+
+def pedido_intervalo(api, r0: int = None, r1: int = None, origem=None):
+    """
+    Requisição das linhas [r0, r1) da origem (ou da aba inteira; r1 None = até o fim).
+    Uma única chamada por intervalo, com uma só renderização: todas as colunas vêm do mesmo instante
+    da planilha (linha inserida/removida entre duas leituras desalinharia Projeto e valores).
+    Projetada: batchGet com majorDimension=COLUMNS, só das colunas usadas.
+    """
+    planilha, aba = _origem(origem)[:2]
+    lin0 = str(r0 + 1) if r0 is not None else ""
+    lin1 = str(r1) if r0 is not None and r1 is not None else ""
+    render = "UNFORMATTED_VALUE" if LEITURA_TIPADA else "FORMATTED_VALUE"
+    # datas como texto exibido mesmo na leitura tipada (sem isso viriam como número de série)
+    if not LEITURA_PROJETADA:
+        return api.values().get(
+            spreadsheetId=planilha, range=f"{aba}!A{lin0}:{_ULTIMA_COL}{lin1}", valueRenderOption=render,
+            dateTimeRenderOption="FORMATTED_STRING"
+        )
+    return api.values().batchGet(
+        spreadsheetId=planilha,
+        ranges=[f"{aba}!{index_to_col_letter(a)}{lin0}:{index_to_col_letter(b)}{lin1}" for a, b in _faixas_leitura()],
+        majorDimension="COLUMNS",
+        valueRenderOption=render,
+        dateTimeRenderOption="FORMATTED_STRING"
+    )
+
+def linhas_do_intervalo(res: dict) -> List[List]:
+    """Resposta de pedido_intervalo → linhas no layout do destino (ordem da PROJECAO)."""
+    if not LEITURA_PROJETADA:
+        rows = projetar_linhas(res.get("values", []))
+    else:
+        colunas = {}
+        for (a, b), vr in zip(_faixas_leitura(), res.get("valueRanges", [])):
+            cols = vr.get("values", [])
+            for k, idx in enumerate(range(a, b + 1)):
+                colunas[idx - 1] = cols[k] if k < len(cols) else []
+        ordem = [colunas.get(i, []) for i in _IDX_ORIGEM]
+        n = max((len(c) for c in ordem), default=0)
+        rows = [[c[i] if i < len(c) else "" for c in ordem] for i in range(n)]
+    if LEITURA_TIPADA:
+        texto = [j for j, (_, _, numerica) in enumerate(PROJECAO) if not numerica]
+        for r in rows:
+            for j in texto:
+                if j < len(r):
+                    r[j] = texto_local(r[j])
+    return rows
+
+def ler_intervalo(api, r0: int = None, r1: int = None, origem=None):
+    """Uma tentativa de leitura, sob a cota e nas métricas (para quem trata as próprias falhas)."""
+    aguardar_cota()
+    return linhas_do_intervalo(medir(pedido_intervalo(api, r0, r1, origem), "Ler origem"))
+
+def read_all_once(api, origem=None):
+    """Tenta ler a origem de uma vez só (rápido)."""
+    _, _, ini, fim, _ = _origem(origem)
+    if ini or fim is not None:
+        return ler_intervalo(api, ini, fim, origem)
+    return ler_intervalo(api, origem=origem)
+
+def count_rows_adaptive(api, origem=None):
     """Conta linhas pela coluna A com retry; robusto a quedas intermitentes."""
-    res = retry(lambda: api.values().get(
-        spreadsheetId=ORIGEM_ID,
-        range=f"{ABA_ORIGEM}!A:A"
-    ).execute(), "Ler total de linhas (A:A)")
+    planilha, aba, ini, fim, _ = _origem(origem)
+    res = retry(api.values().get(
+        spreadsheetId=planilha,
+        range=f"{aba}!A{ini + 1}:A{fim or ''}" if (ini or fim is not None) else f"{aba}!A:A"
+    ), "Ler total de linhas (A:A)")
     return len(res.get("values", []))
 
-def read_segmented(api, total: int):
+def read_segmented(api, total: int, origem=None):
     """
-    Lê A:AC em segmentos adaptativos.
+    Lê a origem em segmentos adaptativos, entregando (linha inicial 0-based, bloco) à medida que chegam.
     Se der 503 no segmento, reduz o tamanho pela metade e tenta de novo.
     """
+    ini = _origem(origem)[2]
     seg_size = SEG_INIT
-    rows = []
     pos = 0
     while pos < total:
         r1 = min(pos + seg_size, total)
-        rng = f"{ABA_ORIGEM}!A{pos+1}:AC{r1}"  # inclui AC
         try:
-            res = retry(lambda: api.values().get(
-                spreadsheetId=ORIGEM_ID, range=rng
-            ).execute(), f"Ler bloco A:AC {pos+1}-{r1}")
-            bloco = res.get("values", [])
-            # normaliza o bloco para caber no intervalo
-            if len(bloco) < (r1 - pos):
-                bloco = bloco + [[] for _ in range((r1 - pos) - len(bloco))]
-            rows.extend(bloco)
-            log(f"📥 Lido {len(rows)}/{total}")
-            pos = r1
-            time.sleep(0.2)
-            if seg_size < 4000:
-                seg_size = min(seg_size + 200, 4000)
+            bloco = linhas_do_intervalo(retry(pedido_intervalo(api, ini + pos, ini + r1, origem), f"Ler bloco {pos+1}-{r1}"))
         except Exception as e:
+            if isinstance(e, HttpError):
+                raise  # erro definitivo (400/403/404): diminuir o bloco não resolve
             new_seg = max(seg_size // 2, SEG_MIN)
             if new_seg == seg_size:
                 raise
             log(f"🔻 Reduzindo segmento: {seg_size} → {new_seg}")
             seg_size = new_seg
-    return rows
+            continue
+        # normaliza o bloco para caber no intervalo
+        if len(bloco) < (r1 - pos):
+            bloco = bloco + [[] for _ in range((r1 - pos) - len(bloco))]
+        log(f"📥 Lido {r1}/{total}")
+        yield pos, bloco
+        pos = r1
+        if seg_size < SEG_MAX:
+            seg_size = min(seg_size + SEG_PASSO, SEG_MAX)
+
+def _ler_intervalo(creds, r0: int, r1: int, origem=None):
+    with etapa("leitura", registrar=False):  # o tempo da leitura é medido por quem consome os blocos
+        return ler_intervalo(api_da_thread(creds), r0, r1, origem)
 
-def main():
-    log("🚀 BD_Carteira → BD_Esteira (A→A, AB→B, Z→C, X→D, AC→E | leitura adaptativa)")
+def read_parallel(creds, api, origem=None):
+    """
+    Lê a origem em vários intervalos simultâneos (cada thread com seu Http), entregando
+    (linha inicial 0-based, bloco) em ordem. Tamanho do segmento e concorrência seguem AIMD:
+    sobem aos poucos a cada sucesso e caem pela metade em 429/5xx/timeout.
+    O total de linhas vem da coluna A, como na leitura segmentada: trechos vazios no meio
+    dos dados não encerram a leitura.
+    """
+    ini = _origem(origem)[2]
+    total = count_rows_adaptive(api, origem)
+    if total == 0:
+        log("⚠️ Nenhuma linha encontrada na origem.")
+        return
+    log(f"🔢 Total detectado: {total}")
+    seg, conc, acertos, falhas = SEG_INIT, PAR_INIT, 0, 0
+    prox, cursor = 0, 0
+    pendentes = deque()   # intervalos a refazer depois de uma falha
+    em_voo, prontos = {}, {}
 
-    api = get_services()
+    with ThreadPoolExecutor(max_workers=PAR_MAX) as pool:
+        while True:
+            while len(em_voo) < conc and (pendentes or prox < total):
+                if pendentes:
+                    r0, r1 = pendentes.popleft()
+                else:
+                    r0, r1 = prox, min(prox + seg, total)
+                    prox = r1
+                em_voo[pool.submit(_ler_intervalo, creds, ini + r0, ini + r1, origem)] = (r0, r1)
+            if not em_voo:
+                break
 
-    # 1) TENTA LEITURA ÚNICA (A:AC)
-    rows = None
-    if INIT_READ_ALL:
-        log("📥 Tentando leitura única A:AC…")
-        try:
-            leitura = None
-            for i in range(2):  # duas tentativas rápidas
+            feitos, _ = wait(em_voo, return_when=FIRST_COMPLETED)
+            for fut in feitos:
+                r0, r1 = em_voo.pop(fut)
                 try:
-                    leitura = read_all_once(api)
-                    break
+                    prontos[r0] = (r1, fut.result())
                 except Exception as e:
-                    wait = 2 + i * 3
-                    log(f"⚠️ Leitura única falhou (tentativa {i+1}/2): {e} | aguardando {wait}s")
-                    time.sleep(wait)
-            if leitura:
-                rows = leitura.get("values", [])
-        except Exception:
-            rows = None
-
-    # 2) Fallback: leitura segmentada
-    if rows is None:
-        log("🔁 Fallback: leitura segmentada adaptativa.")
-        total = count_rows_adaptive(api)
-        if total == 0:
-            log("⚠️ Nenhuma linha encontrada na origem.")
+                    # 429/5xx/timeout: sinal para reduzir a pressão (AIMD); o resto é fatal
+                    falhas += 1
+                    if not retentavel(e) or falhas > MAX_RETRIES or not consumir_orcamento():
+                        raise
+                    conc, seg = max(1, conc // 2), max(SEG_MIN, seg // 2)
+                    pedido = retry_after(e)
+                    wait_s = min(90, pedido if pedido is not None else BACKOFF_BASE*(2**(falhas-1)) + random.uniform(0,1.5))
+                    log(f"🔻 Bloco {r0+1}-{r1} falhou: {e} | concorrência {conc}, segmento {seg}, aguardando {round(wait_s,1)}s")
+                    pendentes.extend((a, min(a + seg, r1)) for a in range(r0, r1, seg))
+                    time.sleep(wait_s)
+                    continue
+                falhas = 0
+                seg = min(SEG_MAX, seg + SEG_PASSO)
+                acertos += 1
+                if acertos >= conc and conc < PAR_MAX:
+                    conc, acertos = conc + 1, 0
+
+            # entrega em ordem; cada bloco é completado com linhas vazias até o fim do seu intervalo
+            while cursor in prontos:
+                r1, bloco = prontos.pop(cursor)
+                yield cursor, bloco + [[] for _ in range((r1 - cursor) - len(bloco))]
+                log(f"📥 Lido {r1}/{total} (concorrência {conc}, segmento {seg})")
+                cursor = r1
+
+def ler_blocos(api, creds=None, origem=None):
+    """
+    Fonte de blocos (linha inicial 0-based, linhas no layout da PROJECAO): 1 leitura total se possível,
+    senão leitura segmentada adaptativa. 'origem' (uma de fatias_origem()): posições relativas à fatia.
+    """
+    # 1) TENTA LEITURA ÚNICA (projetada ou A:AC)
+    if INIT_READ_ALL:
+        log("📥 Tentando leitura única…")
+        rows = None
+        for i in range(2):  # duas tentativas rápidas
+            try:
+                rows = read_all_once(api, origem)
+                break
+            except Exception as e:
+                wait = 2 + i * 3
+                log(f"⚠️ Leitura única falhou (tentativa {i+1}/2): {e} | aguardando {wait}s")
+                time.sleep(wait)
+        if rows is not None:
+            log(f"🔢 Linhas carregadas: {len(rows)}")
+            if rows:
+                yield 0, rows
             return
-        log(f"🔢 Total detectado: {total}")
-        rows = read_segmented(api, total)
-    else:
-        total = len(rows)
-        log(f"🔢 Linhas carregadas: {total}")
 
+    # 2) Fallback: leitura segmentada (paralela, se possível)
+    if LEITURA_PARALELA and creds is not None:
+        log("🔁 Fallback: leitura segmentada paralela (AIMD).")
+        yield from read_parallel(creds, api, origem)
+        return
+    log("🔁 Fallback: leitura segmentada adaptativa.")
+    total = count_rows_adaptive(api, origem)
     if total == 0:
-        log("⚠️ Nada para escrever.")
+        log("⚠️ Nenhuma linha encontrada na origem.")
         return
+    log(f"🔢 Total detectado: {total}")
+    yield from read_segmented(api, total, origem)
 
-    # 3) Monta saída com cabeçalho preservado
-    #    Colunas: A(0) → A; AB(27) → B; Z(25) → C; X(23) → D; AC(28) → E
-    log("🧪 Preparando dados (A, AB, Z, X, AC)…")
-    out = []
-    for idx, r in enumerate(rows):
-        r = (r + [""]*29)[:29]  # garante 29 colunas até AC
-        a  = r[0]
-        ab = r[27] if idx == 0 else clean_number_br(r[27])  # preserva cabeçalho na 1ª linha
-        z  = r[25]
-        x  = r[23] if idx == 0 else clean_number_br(r[23])  # preserva cabeçalho na 1ª linha
-        ac = r[28]  # AC vai como está (sem limpeza)
-        out.append([a, ab, z, x, ac])
-
-    # 4) Limpa destino e escreve A:E
-    retry(lambda: api.values().clear(
-        spreadsheetId=DESTINO_ID, range=f"{ABA_DESTINO}!A:E"
-    ).execute(), "Limpar destino")
-    log("🧹 Destino limpo.")
-
-    chunks = math.ceil(total / WRITE_CHUNK)
-    enviados = 0
-    for i in range(chunks):
-        r0 = i * WRITE_CHUNK
-        r1 = min((i+1) * WRITE_CHUNK, total)
-        bloco = out[r0:r1]
-        log(f"📦 Gravando {i+1}/{chunks}: linhas {r0+1}-{r1}…")
-        retry(lambda: api.values().update(
+def ler_fatia(api, creds, origem) -> List[List]:
+    """Linhas de uma fatia (layout da PROJECAO), sem as linhas vazias do fim."""
+    rows = []
+    with etapa("leitura", registrar=False):
+        for pos, bloco in ler_blocos(api, creds, origem):
+            rows.extend([] for _ in range(pos - len(rows)))
+            rows.extend(bloco)
+    while rows and all(c in ("", None) for c in rows[-1]):
+        rows.pop()
+    return rows
+
+def ler_origens(api, creds=None):
+    """
+    Blocos da origem para o main: com uma origem só, ler_blocos; com ORIGENS, lê as fatias em paralelo
+    (cada uma com sua leitura única → segmentada, e seu próprio Http) e entrega a junção, na ordem
+    da lista, num bloco só — cabeçalho da 1ª fatia e, com DEDUP_PROJETO, cada Projeto uma vez.
+    """
+    if not ORIGENS:
+        yield from ler_blocos(api, creds)
+        return
+    fatias = fatias_origem()
+    log(f"🧩 Origem fatiada: {len(fatias)} fatia(s), até {ORIGENS_PARALELAS} lidas em paralelo")
+    if creds is None or ORIGENS_PARALELAS <= 1:
+        partes = [ler_fatia(api, creds, f) for f in fatias]
+    else:
+        with ThreadPoolExecutor(max_workers=min(ORIGENS_PARALELAS, len(fatias)), thread_name_prefix="fatia") as pool:
+            partes = list(pool.map(lambda f: ler_fatia(api_da_thread(creds), creds, f), fatias))
+
+    cabecalho, rows = None, []
+    for (planilha, aba, ini, fim, tem_cabecalho), parte in zip(fatias, partes):
+        if tem_cabecalho and parte:
+            cabecalho = parte[0] if cabecalho is None else cabecalho
+            parte = parte[1:]
+        log(f"📥 Fatia {aba} ({planilha}, linhas {ini + 1}:{fim or ''}): {len(parte)} linhas")
+        rows.extend(parte)
+    if DEDUP_PROJETO:
+        vistos, unicas = set(), []
+        for r in rows:
+            chave = str(r[0]).strip() if r and r[0] not in ("", None) else None
+            if chave is not None and chave in vistos:
+                continue
+            vistos.add(chave)
+            unicas.append(r)
+        log(f"🧮 Projetos repetidos descartados: {len(rows) - len(unicas)} (fica a 1ª ocorrência, na ordem das fatias)")
+        rows = unicas
+    if cabecalho is not None:
+        rows.insert(0, cabecalho)
+    log(f"🔢 Linhas carregadas (fatias juntas): {len(rows)}")
+    if rows:
+        yield 0, rows
+
+def _coluna(rows, i: int) -> List:
+    return [r[i] if len(r) > i else "" for r in rows]
+
+def transformar(rows, inicio: int = 0):
+    """
+    Monta a saída com cabeçalho preservado (linha global 0), coluna a coluna,
+    a partir de linhas já no layout da PROJECAO: numéricas passam por clean_column_br.
+    """
+    if not rows:
+        return []
+    cab = 1 if inicio == 0 else 0  # preserva cabeçalho na 1ª linha
+    colunas = []
+    for j, (_, _, numerica) in enumerate(PROJECAO):
+        col = _coluna(rows, j)
+        if numerica:
+            col = col[:cab] + clean_column_br(col[cab:])
+        colunas.append(col)
+    return [list(t) for t in zip(*colunas)]
+
+def gravar_bloco(api, r0: int, linhas, extras=(), creds=None, ao_gravar=None) -> int:
+    """Grava linhas a partir de A{r0+1} (+ extras); retorna nº de requisições."""
+    return gravar_blocos(api, [(r0 + 1, linhas)], extras, creds, f"Gravar destino {r0+1}-{r0+len(linhas)}", ao_gravar)
+
+def gravar_blocos(api, blocos, extras=(), creds=None, desc: str = "Gravar destino", ao_gravar=None) -> int:
+    """
+    Grava [(linha inicial 1-based, linhas)] (+ extras) em values.batchUpdate dimensionados pelo
+    orçamento de bytes adaptativo; retorna nº de requisições. Com creds, os lotes sobem em paralelo
+    (sheets_comum.ESCRITA_PARALELA), cada thread com seu próprio Http. ao_gravar(lote): diário.
+    """
+    lotes = planejar_escrita(ABA_DESTINO, blocos, extras)
+    dono = threading.current_thread()
+
+    def _requisicao(lote):
+        alvo = api if (creds is None or threading.current_thread() is dono) else api_da_thread(creds)
+        return alvo.values().batchUpdate(
             spreadsheetId=DESTINO_ID,
-            range=f"{ABA_DESTINO}!A{r0+1}",
-            valueInputOption="USER_ENTERED",
-            body={"values": bloco}
-        ).execute(), f"Gravar destino {r0+1}-{r1}")
-        enviados = r1
-        log(f"✅ Gravado {enviados}/{total}")
-        time.sleep(0.2)
-
-    # 5) Timestamp em G2 (horário Brasília)
+            body={"valueInputOption": "USER_ENTERED", "data": lote}
+        )
+    return gravar_lotes(_requisicao, lotes, desc, log, paralelo=creds is not None,
+                        tentativas=MAX_RETRIES, backoff=BACKOFF_BASE, ao_gravar=ao_gravar)
+
+def ler_destino_atual(api) -> List[List]:
+    """A:E atual de BD_Esteira sem formatação (números chegam como números): base do delta."""
+    res = retry(api.values().get(
+        spreadsheetId=DESTINO_ID, range=f"{ABA_DESTINO}!A:E", valueRenderOption="UNFORMATTED_VALUE",
+        dateTimeRenderOption="FORMATTED_STRING"
+    ), f"Ler {ABA_DESTINO}!A:E atual (base do delta)")
+    return res.get("values", [])
+
+def deslocar_linhas(api, estrutura, linhas_base: int) -> int:
+    """
+    Aplica as inserções/remoções do delta num único spreadsheets.batchUpdate, deslocando só as
+    células das colunas da PROJECAO (o resto da aba, como o G2, não se mexe). Retorna nº de batchUpdates.
+    """
+    meta = retry(api.get(
+        spreadsheetId=DESTINO_ID, fields="sheets.properties(sheetId,title,gridProperties.rowCount)"
+    ), "Ler grade do destino")
+    props = next((sh.get("properties", {}) for sh in meta.get("sheets", [])
+                  if sh.get("properties", {}).get("title") == ABA_DESTINO), None)
+    if props is None:
+        raise RuntimeError(f"Aba '{ABA_DESTINO}' não encontrada no destino.")
+    sheet_id = props.get("sheetId")
+    requests = []
+    # garante espaço para as inserções: células empurradas além da grade se perderiam
+    falta = linhas_base + sum(n for op, _, n in estrutura if op == "inserir") - props.get("gridProperties", {}).get("rowCount", 0)
+    if falta > 0:
+        requests.append({"appendDimension": {"sheetId": sheet_id, "dimension": "ROWS", "length": falta}})
+    for op, linha, n in estrutura:
+        grade = {"sheetId": sheet_id, "startRowIndex": linha, "endRowIndex": linha + n,
+                 "startColumnIndex": 0, "endColumnIndex": len(PROJECAO)}
+        requests.append({"insertRange" if op == "inserir" else "deleteRange": {"range": grade, "shiftDimension": "ROWS"}})
+    if not requests:
+        return 0
+    retry(api.batchUpdate(spreadsheetId=DESTINO_ID, body={"requests": requests}),
+          f"Deslocar linhas de {ABA_DESTINO} ({len(estrutura)} trecho(s))")
+    return 1
+
+def gravar_delta(api, creds, base: List[List], tabela: List[List], extras,
+                 ao_planejar=None, ao_gravar=None) -> Tuple[Optional[int], dict]:
+    """
+    Leva BD_Esteira de 'base' (conteúdo atual) para 'tabela' casando linhas pela coluna A (Projeto).
+    ao_planejar(blocos) recebe o que falta gravar depois dos deslocamentos (diário de retomada).
+    Retorna (nº de requisições, relatório); requisições = None quando nada mudou.
+    """
+    with etapa("delta"):
+        plano = delta_por_chave(base, tabela)
+        blocos_pos, _ = diferencas(base, tabela)
+    posicional = sum(len(b) for _, b in blocos_pos)
+    relatorio = {k: plano[k] for k in ("inseridos", "alterados", "removidos")}
+    log(f"🔑 Delta por Projeto (A): +{plano['inseridos']} novos, ~{plano['alterados']} alterados, "
+        f"-{plano['removidos']} removidos (de {max(0, len(base) - 1)} → {len(tabela) - 1} linhas)")
+    if not plano["blocos"] and not plano["estrutura"]:
+        return None, {**relatorio, "regravadas": 0}
+
+    reqs = 0
+    # (uma reordenação geral casa poucas linhas por acaso: deslocar custaria mais do que regravar)
+    if (plano["estrutura"] and len(plano["estrutura"]) <= DELTA_MAX_DESLOCAMENTOS
+            and plano["regravadas"] <= posicional * (1 - DELTA_ECONOMIA_MIN)):
+        log(f"↕️ Deslocando {len(plano['estrutura'])} trecho(s) de A:E (inserções/remoções no meio)")
+        with etapa("deslocamento"):
+            reqs += deslocar_linhas(api, plano["estrutura"], len(base))
+        blocos = plano["blocos"]
+    else:
+        blocos = blocos_pos if plano["estrutura"] else plano["blocos"]
+    regravadas = sum(len(b) for _, b in blocos)
+    log(f"✏️ Regravando {regravadas} linha(s) em {len(blocos)} intervalo(s) (reescrita completa: {len(tabela)})")
+    if ao_planejar:
+        ao_planejar(blocos)
+    with etapa("escrita"):
+        reqs += gravar_blocos(api, blocos, extras, creds, f"Gravar delta ({regravadas} linhas)", ao_gravar)
+    return reqs, {**relatorio, "regravadas": regravadas}
+
+def main(creds=None, api=None, coletar: bool = False):
+    """
+    Executa a exportação. No pipeline unificado recebe credenciais/serviço já autenticados e,
+    com coletar=True, devolve a tabela A:E gravada (cabeçalho incluso) para a replicação.
+    Devolve None quando nada foi gravado (inclusive quando a origem não mudou).
+    """
+    mapa = ", ".join(f"{o}→{d}" for o, d, _ in PROJECAO)
+    log(f"🚀 {ABA_ORIGEM} → {ABA_DESTINO} ({mapa} | leitura adaptativa{', projetada' if LEITURA_PROJETADA else ''})")
+
+    creds = creds or get_credentials()
+    renovar_token(creds, log=log)
+    api   = api or novo_api(creds)
+
+    # 0) Detecção de mudanças: versão no Drive (barata) e, se mudou, hash do conteúdo x snapshot
+    # (o diário vem antes das saídas antecipadas: escrita interrompida é terminada primeiro)
+    estado, versao, snap, drive, diario = {}, None, None, None, None
+    pendente = False
+    if DETECTAR_MUDANCAS:
+        estado = {} if FORCAR else carregar_json(ESTADO_EXPORTAR)
+        snap   = None if FORCAR else carregar_snapshot()
+        drive  = novo_drive(creds)
+        diario = abrir_diario(DIARIO_EXPORTAR)
+        pendente = DESTINO_ID in diario["parciais"]
+        if pendente:
+            log(f"⏯️ Diário com escrita interrompida em {ABA_DESTINO}: sem atalhos nesta execução")
+        with etapa("detecção de mudanças"):
+            versao = versao_origem(drive)
+        if snap and versao and estado.get("origem") == versao and not pendente:
+            log(f"💤 {ABA_ORIGEM} sem alterações no Drive ({versao.get('modifiedTime')}). Nada a fazer.")
+            return None
+
+    # Timestamp em G2 (horário Brasília) — vai no mesmo batchUpdate do primeiro bloco
     br_now = datetime.datetime.utcnow() - datetime.timedelta(hours=3)
     timestamp = br_now.strftime("%d/%m/%Y %H:%M:%S")
-    retry(lambda: api.values().update(
-        spreadsheetId=DESTINO_ID,
-        range=f"{ABA_DESTINO}!G2",
-        valueInputOption="USER_ENTERED",
-        body={"values": [[timestamp]]}
-    ).execute(), "Gravar timestamp em G2")
+    extras = [(f"{ABA_DESTINO}!G2", [[timestamp]])]
+
+    relatorio = None
+    # 1-2) leitura completa antes de qualquer escrita: uma falha na leitura deixa o destino como estava
+    #      (e o delta/snapshot precisam da tabela inteira)
+    rows = []
+    for _, bloco in cronometrar(ler_origens(api, creds), "leitura"):
+        rows.extend(bloco)
+    total = len(rows)
+    if total == 0:
+        log("⚠️ Nada para escrever.")
+        return None
+
+    # 3) Monta saída com cabeçalho preservado
+    log(f"🧪 Preparando dados ({', '.join(o for o, _, _ in PROJECAO)})…")
+    with etapa("transformação"):
+        tabela = transformar(rows)
+    del rows
+
+    h = hash_linhas(tabela)
+    if snap and h == snap.get("hash") and estado.get("destino") and not pendente:
+        # o snapshot só vale pelo destino se ninguém (nem uma escrita interrompida) mexeu nele desde então
+        with etapa("detecção de mudanças"):
+            intacto = versao_drive(drive, DESTINO_ID, retry) == estado["destino"]
+        if intacto:
+            log(f"💤 Conteúdo projetado idêntico ao snapshot local ({total} linhas) e {ABA_DESTINO} "
+                f"sem alterações desde a última escrita. Só o timestamp.")
+            with etapa("escrita"):
+                gravar_blocos(api, [], extras, creds, "Gravar timestamp")
+            log(f"🕒 Timestamp gravado em {ABA_DESTINO}!G2: {timestamp}")
+            salvar_json(ESTADO_EXPORTAR, {**estado, "origem": versao, "destino": versao_drive(drive, DESTINO_ID, retry)})
+            return None
+        log(f"🔎 Conteúdo igual ao snapshot, mas {ABA_DESTINO} mudou desde a última escrita: conferindo o destino")
+
+    # Diário: se a execução anterior caiu no meio da escrita deste mesmo conteúdo, grava só o que faltou
+    anotar = planejar = parcial = None
+    if DETECTAR_MUDANCAS:
+        parcial  = diario_parcial(diario, DESTINO_ID, h)
+        anotar   = lambda lote: diario_lote(diario, DIARIO_EXPORTAR, DESTINO_ID, h, linhas_do_lote(lote))
+        planejar = lambda blocos: diario_plano(diario, DIARIO_EXPORTAR, DESTINO_ID, h,
+                                               [(r0, len(b)) for r0, b in blocos])
+
+    # 4) Escreve A:E + timestamp: o que faltou de uma escrita interrompida, só o delta por Projeto, ou tudo
+    if parcial and parcial.get("plano") is not None:
+        blocos = descontar_feitos([(r0, tabela[r0 - 1:r0 - 1 + n]) for r0, n in parcial["plano"]], parcial["feitos"])
+        faltam = sum(len(b) for _, b in blocos)
+        log(f"⏯️ Retomando escrita interrompida: faltam {faltam} linha(s) em {len(blocos)} intervalo(s)")
+        with etapa("escrita"):
+            reqs = gravar_blocos(api, blocos, extras, creds, f"Retomar destino ({faltam} linhas)", anotar)
+        relatorio = {"retomadas": faltam}
+    elif MODO_DELTA:
+        base = None
+        if snap and drive is not None and estado.get("destino"):
+            with etapa("detecção de mudanças"):
+                if versao_drive(drive, DESTINO_ID, retry) == estado["destino"]:
+                    base = linhas_do_snapshot(snap)
+                    log(f"🗂️ Base do delta: snapshot local ({ABA_DESTINO} sem alterações desde a última escrita)")
+        if base is None:
+            with etapa("leitura do destino"):
+                base = ler_destino_atual(api)
+        reqs, relatorio = gravar_delta(api, creds, base, tabela, extras, planejar, anotar)
+        if reqs is None:
+            log(f"💤 {ABA_DESTINO} já está igual à origem ({total} linhas). Só o timestamp.")
+            with etapa("escrita"):
+                gravar_blocos(api, [], extras, creds, "Gravar timestamp")
+            log(f"🕒 Timestamp gravado em {ABA_DESTINO}!G2: {timestamp}")
+            if DETECTAR_MUDANCAS:
+                salvar_snapshot(tabela)
+                salvar_json(ESTADO_EXPORTAR, {"origem": versao, "hash": h, "linhas": total,
+                                              "destino": versao_drive(drive, DESTINO_ID, retry), "delta": relatorio})
+                encerrar_diario(DIARIO_EXPORTAR, diario)
+            return None
+    else:
+        log(f"📦 Gravando {total} linhas…")
+        if planejar:
+            planejar([(1, tabela)])
+        with etapa("escrita"):
+            reqs = gravar_bloco(api, 0, tabela, extras, creds, anotar)
+        log(f"✅ Gravado {total}/{total}")
     log(f"🕒 Timestamp gravado em {ABA_DESTINO}!G2: {timestamp}")
 
-    log(f"🏁 Concluído: {enviados} linhas.")
+    # 5) Limpa só as linhas que sobrarem abaixo dos dados novos
+    with etapa("limpeza"):
+        retry(api.values().batchClear(
+            spreadsheetId=DESTINO_ID, body={"ranges": [f"{ABA_DESTINO}!A{total+1}:E"]}
+        ), "Limpar sobra do destino")
+    log("🧹 Linhas antigas abaixo dos dados limpas.")
+
+    registrar_economia(requisicoes_legadas(total, WRITE_CHUNK), reqs + 1)
+    log(f"📉 Escrita: {resumo_economia()}")
+
+    if DETECTAR_MUDANCAS:
+        # versão do destino logo após a nossa escrita: se continuar igual, o snapshot serve de base do próximo delta
+        salvar_snapshot(tabela)
+        salvar_json(ESTADO_EXPORTAR, {"origem": versao, "hash": h, "linhas": total,
+                                      "destino": versao_drive(drive, DESTINO_ID, retry), "delta": relatorio})
+        if diario is not None:
+            encerrar_diario(DIARIO_EXPORTAR, diario)
+
+    log(f"🏁 Concluído: {total} linhas.")
+    return tabela if coletar else None
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,104 @@
+"""
+Pipeline completo num único processo: BD_Carteira → BD_Esteira → destinos.
+
+Uma única autenticação e um único serviço do Sheets para as duas etapas; a tabela
+gerada pela exportação segue em memória direto para a replicação, sem reler
+BD_Esteira!A:E. Os dois scripts continuam executáveis separadamente.
+
+Modo contínuo (--watch), para rodar local ou num runner próprio: consulta a versão da
+BD_Carteira no Drive a cada --intervalo segundos e, quando ela muda e fica parada por
+--debounce segundos, sincroniza com o cliente já autenticado, replicando só os destinos
+das unidades (coluna E) cujas linhas mudaram.
+
+Uso:
+  python pipeline_bd_esteira.py
+  python pipeline_bd_esteira.py --watch --intervalo 20 --debounce 10
+"""
+import os, time, argparse
+import sheets_comum
+import exportar_esteira_carteira as exportar
+import replicar_bd_esteira as replicar
+from estado_esteira import carregar_snapshot, linhas_do_snapshot
+
+# ============== MODO CONTÍNUO ==============
+INTERVALO_WATCH = float(os.getenv("BD_ESTEIRA_INTERVALO", "20"))  # s entre consultas da versão da origem
+DEBOUNCE_WATCH  = float(os.getenv("BD_ESTEIRA_DEBOUNCE", "10"))   # origem sem mudar por esse tempo antes de sincronizar
+DEBOUNCE_MAX    = 120  # com edição sem pausa, sincroniza mesmo assim depois disso
+
+def ciclo(creds, service, anterior=None):
+    """
+    Exportação + replicação. Com 'anterior' (tabela da sincronização passada), a replicação
+    fica restrita às unidades alteradas. Devolve a tabela gravada (None se nada mudou).
+    """
+    tabela = exportar.main(creds=creds, api=service.spreadsheets(), coletar=True)
+
+    # a replicação lê da mesma planilha que a exportação grava
+    fonte = tabela if replicar.ORIGEM_ID == exportar.DESTINO_ID and replicar.ABA_FONTE == exportar.ABA_DESTINO else None
+    unidades = replicar.unidades_alteradas(anterior, fonte) if anterior is not None and fonte is not None else None
+    replicar.main(creds=creds, service=service, fonte=fonte, unidades=unidades)
+    return tabela
+
+def main():
+    exportar.log("🔗 Pipeline unificado: exportação → replicação no mesmo processo")
+    creds   = replicar.get_credentials()
+    service = replicar.novo_servico(creds)
+    ciclo(creds, service)
+
+def aguardar_estabilizar(drive, versao: dict, debounce: float) -> dict:
+    """Espera a origem ficar 'debounce' s sem nova versão (no máximo DEBOUNCE_MAX s); devolve a última vista."""
+    inicio = ultima = time.monotonic()
+    passo = max(1.0, debounce / 3)
+    while time.monotonic() - ultima < debounce and time.monotonic() - inicio < DEBOUNCE_MAX:
+        time.sleep(passo)
+        v = exportar.versao_origem(drive)
+        if v and v != versao:
+            versao, ultima = v, time.monotonic()
+    return versao
+
+def vigiar(intervalo: float = INTERVALO_WATCH, debounce: float = DEBOUNCE_WATCH):
+    """Laço do modo contínuo: um ciclo a cada nova versão da origem, com serviços criados uma vez só."""
+    exportar.log(f"👀 Modo contínuo: {exportar.ABA_ORIGEM} consultada a cada {intervalo:g}s (debounce {debounce:g}s)")
+    creds   = replicar.get_credentials()
+    service = replicar.novo_servico(creds)
+    drive   = replicar.novo_drive(creds)
+    snap    = carregar_snapshot()
+    anterior = linhas_do_snapshot(snap) if snap else None  # base das unidades alteradas no 1º ciclo
+    vista, n = None, 0
+    try:
+        while True:
+            versao = exportar.versao_origem(drive)
+            if versao and versao != vista:
+                if vista is not None:  # na partida sincroniza logo (o que mudou com o processo parado)
+                    exportar.log(f"✏️ {exportar.ABA_ORIGEM} alterada ({versao.get('modifiedTime')}); aguardando estabilizar…")
+                    versao = aguardar_estabilizar(drive, versao, debounce)
+                n += 1
+                t0 = time.monotonic()
+                try:
+                    sheets_comum.renovar_token(creds, log=exportar.log)
+                    tabela = ciclo(creds, service, anterior)
+                    if tabela is not None:
+                        anterior = tabela
+                    vista = versao
+                    exportar.log(f"⏱️ Ciclo {n} concluído em {time.monotonic() - t0:.1f}s")
+                except Exception as e:
+                    exportar.log(f"❌ Ciclo {n} falhou ({e}); nova tentativa na próxima consulta")
+                finally:
+                    # cada ciclo é uma execução: métricas próprias, orçamento de retries e metadados renovados
+                    sheets_comum.emitir_metricas(f"Métricas — pipeline contínuo, ciclo {n}")
+                    sheets_comum.reiniciar_metricas()
+                    sheets_comum.reiniciar_orcamento()
+                    replicar.invalidar_metadados()
+            time.sleep(intervalo)
+    except KeyboardInterrupt:
+        exportar.log("🛑 Modo contínuo encerrado.")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--watch", action="store_true", help="fica rodando e sincroniza a cada mudança da origem")
+    ap.add_argument("--intervalo", type=float, default=INTERVALO_WATCH, help="segundos entre consultas ao Drive")
+    ap.add_argument("--debounce", type=float, default=DEBOUNCE_WATCH, help="segundos sem mudança antes de sincronizar")
+    args = ap.parse_args()
+    if args.watch:
+        vigiar(args.intervalo, args.debounce)
+    else:
+        main()
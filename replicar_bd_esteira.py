@@ -1,9 +1,13 @@
-import datetime, time, random, math, re, os, json
-from typing import List, Tuple, Optional
+import datetime, re, os, json, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Optional
 from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-import google_auth_httplib2, httplib2
+from sheets_comum import (planejar_escrita, gravar_lotes, linhas_do_lote, descontar_feitos, requisicoes_legadas,
+                          registrar_economia, resumo_economia, novo_cliente, cliente_da_thread, renovar_token,
+                          executar, etapa, col_letter_to_index, diferencas, texto_local)
+from estado_esteira import (carregar_json, salvar_json, hash_linhas, versao_drive, abrir_diario, diario_parcial,
+                            diario_lote, diario_concluido, encerrar_diario, FORCAR)
 
 # ============== CONFIG ==============
 ORIGEM_ID   = "1T6HVLBQi21CIeS64tAjI314TYi2795COOCAakzLV-q0"  # planilha origem
@@ -21,12 +25,21 @@ CRED_FILE   = "credenciais.json"
 
 SCOPES       = ["https://www.googleapis.com/auth/spreadsheets",
                 "https://www.googleapis.com/auth/drive"]
-HTTP_TIMEOUT = 600
 MAX_RETRIES  = 8
 BACKOFF_BASE = 3.0
-WRITE_CHUNK  = 1500
+WRITE_CHUNK  = 1500  # só como referência do fluxo antigo (relatório de requisições economizadas)
+MAX_WORKERS  = int(os.getenv("REPLICAR_WORKERS", "4"))  # destinos processados em paralelo (1 = sequencial)
+FOLGA_GRADE  = 0.2   # ao aumentar a grade de um destino, 20% de linhas a mais (as próximas execuções não redimensionam)
+MODO_INCREMENTAL = True  # compara com o A:E atual do destino e grava só as linhas alteradas
+DETECTAR_MUDANCAS = True  # pula a execução (versão no Drive) ou a releitura do destino (hash da fatia) quando nada mudou
+# G2 de cada destino = última replicação que passou por ele: é gravado mesmo sem mudança na fatia, mas
+# não quando a execução inteira é pulada (origem sem nova versão) nem, no modo contínuo, nos destinos
+# de unidades que não mudaram.
+ESTADO_REPLICAR   = "replicar.json"
+DIARIO_REPLICAR   = "replicar_diario.json"  # destinos/lotes concluídos da execução em curso (retomada após queda)
 
 # Cabeçalho padrão solicitado:
+COLUNAS_NUMERICAS = (1, 3)  # B (Valor Considerado) e D (Valor Recebido): números gravados pela exportação
 DEFAULT_HEADER = [
     "Projeto",
     "Valor Considerado",
@@ -36,24 +49,22 @@ DEFAULT_HEADER = [
 ]
 
 # ============== LOG / RETRY ==============
+_local = threading.local()  # por thread: tag do destino no log
+
 def log(msg: str):
-    # Log sempre em horário de Brasília (UTC-3)
+    # Log sempre em horário de Brasília (UTC-3); em paralelo, prefixa o destino da thread
     br_now = datetime.datetime.utcnow() - datetime.timedelta(hours=3)
-    print(f"[{br_now.strftime('%H:%M:%S')}] {msg}", flush=True)
+    tag = getattr(_local, "tag", None)
+    prefixo = f"[{tag}] " if tag else ""
+    print(f"[{br_now.strftime('%H:%M:%S')}] {prefixo}{msg}", flush=True)
 
 def retry(fn, desc: str):
-    for att in range(1, MAX_RETRIES + 1):
-        try:
-            return fn()
-        except Exception as e:
-            wait = min(90, BACKOFF_BASE * (2 ** (att - 1)) + random.uniform(0, 1.5))
-            log(f"Aviso: {desc} — tentativa {att}/{MAX_RETRIES} falhou: {e} | aguardando {round(wait,1)}s")
-            time.sleep(wait)
-    raise RuntimeError(f"{desc} — falhou após {MAX_RETRIES} tentativas.")
+    """Camada comum (sheets_comum.executar): cota global, erros fatais sem retry, Retry-After e orçamento."""
+    return executar(fn, desc, log, tentativas=MAX_RETRIES, backoff=BACKOFF_BASE)
 
 # ============== AUTENTICAÇÃO ==============
-def get_api():
-    """Retorna o serviço completo do Sheets, lendo credenciais do secret GOOGLE_CREDENTIALS ou do arquivo local."""
+def get_credentials():
+    """Lê credenciais do secret GOOGLE_CREDENTIALS ou do arquivo local."""
     env_json = os.getenv("GOOGLE_CREDENTIALS")
     if env_json:
         try:
@@ -66,23 +77,65 @@ def get_api():
     else:
         log("ℹ️ GOOGLE_CREDENTIALS não definido, usando credenciais.json (local).")
         creds = Credentials.from_service_account_file(CRED_FILE, scopes=SCOPES)
+    return creds
+
+def novo_servico(creds):
+    """Serviço do Sheets com conexão persistente exclusiva (httplib2 não é thread-safe)."""
+    return novo_cliente(creds)
 
-    http  = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
-    return build("sheets", "v4", http=http)
+def novo_drive(creds):
+    """Serviço do Drive (só para ler modifiedTime/version da origem e dos destinos)."""
+    return novo_cliente(creds, "drive", "v3")
+
+def get_api():
+    """Retorna o serviço completo do Sheets, lendo credenciais do secret GOOGLE_CREDENTIALS ou do arquivo local."""
+    return novo_servico(get_credentials())
+
+# ============== METADADOS (cache por execução) ==============
+META_FIELDS = "sheets.properties(sheetId,title,gridProperties(rowCount,columnCount))"
+
+_meta_cache: Dict[str, dict] = {}
+_meta_lock  = threading.Lock()
+
+def obter_metadados(service, spreadsheet_id: str) -> dict:
+    """Um único spreadsheets.get mascarado por planilha e execução; as demais consultas saem do cache."""
+    with _meta_lock:
+        meta = _meta_cache.get(spreadsheet_id)
+    if meta is None:
+        meta = retry(
+            service.spreadsheets().get(spreadsheetId=spreadsheet_id, fields=META_FIELDS),
+            f"Ler metadados da planilha {spreadsheet_id}"
+        )
+        with _meta_lock:
+            _meta_cache[spreadsheet_id] = meta
+    return meta
+
+def invalidar_metadados(spreadsheet_id: Optional[str] = None):
+    with _meta_lock:
+        if spreadsheet_id is None:
+            _meta_cache.clear()
+        else:
+            _meta_cache.pop(spreadsheet_id, None)
+
+def _atualizar_grade_no_cache(spreadsheet_id: str, sheet_id: int, rows: int, cols: int):
+    """Reflete localmente o nosso próprio updateSheetProperties, sem novo get."""
+    with _meta_lock:
+        meta = _meta_cache.get(spreadsheet_id)
+        for s in (meta or {}).get("sheets", []):
+            props = s.get("properties", {}) or {}
+            if props.get("sheetId") == sheet_id:
+                gp = props.setdefault("gridProperties", {})
+                gp["rowCount"], gp["columnCount"] = rows, cols
+                return
+    invalidar_metadados(spreadsheet_id)
 
 # ============== AUXILIARES ==============
 def listar_abas(service, spreadsheet_id: str) -> List[str]:
-    meta = retry(
-        lambda: service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute(),
-        f"Ler metadados da planilha {spreadsheet_id}"
-    )
+    meta = obter_metadados(service, spreadsheet_id)
     return [s.get("properties", {}).get("title", "") for s in meta.get("sheets", [])]
 
 def get_sheet_properties(service, spreadsheet_id: str, sheet_title: str) -> Optional[dict]:
-    meta = retry(
-        lambda: service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute(),
-        f"Ler metadados da planilha {spreadsheet_id}"
-    )
+    meta = obter_metadados(service, spreadsheet_id)
     for s in meta.get("sheets", []):
         props = s.get("properties", {}) or {}
         if props.get("title") == sheet_title:
@@ -95,10 +148,13 @@ def get_sheet_properties(service, spreadsheet_id: str, sheet_title: str) -> Opti
     return None
 
 def ensure_sheet_size(service, spreadsheet_id: str, sheet_title: str,
-                      min_rows: int, min_cols: int = 5):
+                      min_rows: int, min_cols: int = 5) -> bool:
     """
     Garante que a aba tenha pelo menos min_rows linhas e min_cols colunas.
-    Se precisar, aumenta o grid via batchUpdate.
+    A grade vem do cache de metadados: se já couber, nenhuma chamada é feita. Se precisar,
+    aumenta o grid (com FOLGA_GRADE de linhas extras) via batchUpdate — o redimensionamento
+    é do spreadsheets.batchUpdate e não pode ir no values.batchUpdate (USER_ENTERED) dos dados.
+    Retorna True se a grade foi aumentada.
     """
     props = get_sheet_properties(service, spreadsheet_id, sheet_title)
     if not props:
@@ -108,11 +164,11 @@ def ensure_sheet_size(service, spreadsheet_id: str, sheet_title: str,
     current_cols = props["cols"]
     sheet_id     = props["sheetId"]
 
-    new_rows = max(current_rows, min_rows)
+    new_rows = current_rows if current_rows >= min_rows else int(min_rows * (1 + FOLGA_GRADE))
     new_cols = max(current_cols, min_cols)
 
     if new_rows == current_rows and new_cols == current_cols:
-        return  # já está grande o suficiente
+        return False  # já está grande o suficiente
 
     body = {
         "requests": [
@@ -133,18 +189,14 @@ def ensure_sheet_size(service, spreadsheet_id: str, sheet_title: str,
 
     log(f"Ajustando grade de {spreadsheet_id}:{sheet_title} de {current_rows}x{current_cols} para {new_rows}x{new_cols}")
     retry(
-        lambda: service.spreadsheets().batchUpdate(
+        service.spreadsheets().batchUpdate(
             spreadsheetId=spreadsheet_id,
             body=body
-        ).execute(),
+        ),
         f"Ajustar linhas/colunas de {spreadsheet_id}:{sheet_title}"
     )
-
-def col_letter_to_index(letter: str) -> int:
-    n = 0
-    for ch in letter.strip().upper():
-        n = n * 26 + (ord(ch) - ord('A') + 1)
-    return n
+    _atualizar_grade_no_cache(spreadsheet_id, sheet_id, new_rows, new_cols)
+    return True
 
 def achar_aba_config(service) -> str:
     for nome in CONFIG_CANDIDATAS:
@@ -167,9 +219,9 @@ def ler_pares_config(service, aba_config: str) -> List[Tuple[str, str]]:
     bi_rng = f"{aba_config}!{COL_DESTID}{START_ROW}:{COL_DESTID}{rows}"
 
     res = retry(
-        lambda: service.spreadsheets().values().batchGet(
+        service.spreadsheets().values().batchGet(
             spreadsheetId=ORIGEM_ID, ranges=[bh_rng, bi_rng]
-        ).execute(),
+        ),
         "Ler Config (BH/BI)"
     )
     vrs = res.get("valueRanges", [])
@@ -185,14 +237,36 @@ def ler_pares_config(service, aba_config: str) -> List[Tuple[str, str]]:
     return pares
 
 # ============== FONTE (BD_ESTEIRA) ==============
-def ler_esteira_origem(service) -> List[List[str]]:
+def ler_esteira_origem(service) -> List[List]:
+    # sem formatação: B/D voltam como os números que a exportação gravou (o texto exibido
+    # arredondaria e depende da localidade); datas vêm como o texto exibido ("15/07/2023", não o
+    # número de série), como na fonte em memória; normalizar_fonte devolve o resto a texto
     res = retry(
-        lambda: service.spreadsheets().values().get(
-            spreadsheetId=ORIGEM_ID, range=f"{ABA_FONTE}!A:E"
-        ).execute(),
+        service.spreadsheets().values().get(
+            spreadsheetId=ORIGEM_ID, range=f"{ABA_FONTE}!A:E",
+            valueRenderOption="UNFORMATTED_VALUE", dateTimeRenderOption="FORMATTED_STRING"
+        ),
         f"Ler origem {ABA_FONTE}!A:E"
     )
-    return res.get("values", [])
+    return normalizar_fonte(res.get("values", []))
+
+def normalizar_fonte(linhas: List[List]) -> List[List]:
+    """
+    Fonte na representação única da replicação — B/D numéricas como float, demais colunas como
+    texto —, seja a tabela em memória do pipeline ou a relida da aba: mesmos hashes e mesmos valores gravados.
+    """
+    saida = []
+    for r in linhas:
+        linha = []
+        for j, v in enumerate(r):
+            if v is None:
+                v = ""
+            if j in COLUNAS_NUMERICAS:
+                linha.append(float(v) if type(v) in (int, float) else v)
+            else:
+                linha.append(texto_local(v))
+        saida.append(linha)
+    return saida
 
 _num_like = re.compile(r"^\s*[-+]?\d+([.,]\d+)?\s*$")
 
@@ -222,101 +296,304 @@ def filtrar_por_col_E(values: List[List[str]], filtro: str) -> List[List[str]]:
             out.append(r)
     return out
 
+def indexar_por_col_E(values: List[List[str]]) -> Tuple[List[str], Dict[str, List[List[str]]]]:
+    """
+    Agrupa a fonte uma única vez pela coluna E (strip), preservando a ordem original.
+    Retorna (cabeçalho, {unidade: linhas}) — cada destino pega sua fatia em O(1).
+    """
+    tem_header = bool(values) and _tem_cabecalho_aparente(values[0])
+    header = (values[0] + [""]*5)[:5] if tem_header else DEFAULT_HEADER[:]
+    grupos: Dict[str, List[List[str]]] = {}
+    for r in (values[1:] if tem_header else values):
+        r = (r + [""]*5)[:5]
+        grupos.setdefault(str(r[4]).strip(), []).append(r)
+    return header, grupos
+
+def fatia_do_indice(indice: Tuple[List[str], Dict[str, List[List[str]]]], filtro: str) -> List[List[str]]:
+    """Equivalente a filtrar_por_col_E, mas servido pelo índice (cabeçalho + linhas de E == filtro)."""
+    header, grupos = indice
+    return [header[:]] + grupos.get((filtro or "").strip(), [])
+
+def unidades_alteradas(antes: List[List], depois: List[List]) -> Optional[set]:
+    """
+    Valores da coluna E (strip) cujas fatias diferem entre duas versões da fonte; None se o
+    cabeçalho mudou (todas as unidades são afetadas).
+    """
+    (cab_a, grupos_a), (cab_d, grupos_d) = indexar_por_col_E(antes), indexar_por_col_E(depois)
+    if cab_a != cab_d:
+        return None
+    return {u for u in set(grupos_a) | set(grupos_d) if grupos_a.get(u) != grupos_d.get(u)}
+
 # ============== DESTINO ==============
 def planilha_tem_aba(service, spreadsheet_id: str, sheet_title: str) -> bool:
     """Checa se a aba existe na planilha destino."""
     return get_sheet_properties(service, spreadsheet_id, sheet_title) is not None
 
-def limpar_destino(service, dest_id: str, sheet_title: str):
-    retry(
-        lambda: service.spreadsheets().values().clear(
-            spreadsheetId=dest_id, range=f"{sheet_title}!A:E"
-        ).execute(),
-        f"Limpar {dest_id}:{sheet_title}"
-    )
+def limpar_sobra(service, dest_id: str, sheet_title: str, a_partir: int, ate: Optional[int] = None):
+    """Limpa A:E da linha a_partir em diante (ou até 'ate'), via batchClear."""
+    rng = f"{sheet_title}!A{a_partir}:E{ate if ate else ''}"
+    with etapa("limpeza"):
+        retry(
+            service.spreadsheets().values().batchClear(
+                spreadsheetId=dest_id, body={"ranges": [rng]}
+            ),
+            f"Limpar {dest_id}:{rng}"
+        )
 
-def escrever_destino(service, dest_id: str, sheet_title: str, dados: List[List[str]]):
+def gravar_plano(service, dest_id: str, sheet_title: str,
+                 blocos: List[Tuple[int, List[List[str]]]], extras=(), ao_gravar=None) -> int:
+    """
+    Executa o plano de escrita (values.batchUpdate por lote, orçamento de bytes adaptativo; lote que
+    falha é dividido ao meio) e retorna quantas requisições usou. Os lotes de um destino vão em
+    sequência: o paralelismo da replicação já é entre destinos (MAX_WORKERS).
+    """
+    lotes = planejar_escrita(sheet_title, blocos, extras)
+    with etapa("escrita"):
+        return gravar_lotes(
+            lambda lote: service.spreadsheets().values().batchUpdate(
+                spreadsheetId=dest_id,
+                body={"valueInputOption": "USER_ENTERED", "data": lote}
+            ),
+            lotes, f"Escrever {dest_id}:{sheet_title}", log, tentativas=MAX_RETRIES, backoff=BACKOFF_BASE,
+            ao_gravar=ao_gravar
+        )
+
+def escrever_destino(service, dest_id: str, sheet_title: str, dados: List[List[str]], extras=(),
+                     feitos=(), ao_gravar=None):
+    """
+    Reescrita completa: linhas + extras no mínimo de batchUpdates e limpeza só do que sobrar abaixo.
+    'feitos' (diário de uma execução interrompida): intervalos já gravados com este mesmo conteúdo.
+    """
     if not dados:
         return
 
     total = len(dados)
 
-    # garante que a aba tenha linhas suficientes
-    ensure_sheet_size(service, dest_id, sheet_title, min_rows=total, min_cols=5)
+    # garante que a aba tenha linhas suficientes; se a grade cresceu, não há sobra abaixo dos dados
+    # (as linhas antigas cabiam todas em 1..total), então redimensionar ou limpar custa 1 chamada só
+    cresceu = ensure_sheet_size(service, dest_id, sheet_title, min_rows=total, min_cols=5)
+
+    blocos = descontar_feitos([(1, dados)], feitos)
+    if feitos:
+        log(f"Retomando escrita interrompida: faltam {sum(len(b) for _, b in blocos)}/{total} linhas")
+    reqs = gravar_plano(service, dest_id, sheet_title, blocos, extras, ao_gravar)
+    if not cresceu:
+        limpar_sobra(service, dest_id, sheet_title, total + 1)
+    registrar_economia(requisicoes_legadas(total, WRITE_CHUNK), reqs + 1)
+    log(f"Gravado {total}/{total} no destino ({reqs + 1} requisição(ões) de escrita)")
+
+def ler_destino(service, dest_id: str, sheet_title: str) -> List[List]:
+    """A:E atual do destino na mesma representação da fonte (normalizar_fonte): comparação por valor."""
+    with etapa("leitura do destino"):
+        res = retry(
+            service.spreadsheets().values().get(
+                spreadsheetId=dest_id, range=f"{sheet_title}!A:E",
+                valueRenderOption="UNFORMATTED_VALUE", dateTimeRenderOption="FORMATTED_STRING"
+            ),
+            f"Ler {dest_id}:{sheet_title}!A:E"
+        )
+    return normalizar_fonte(res.get("values", []))
 
-    chunks = math.ceil(total / WRITE_CHUNK)
-    enviados = 0
-    for i in range(chunks):
-        r0, r1 = i * WRITE_CHUNK, min((i + 1) * WRITE_CHUNK, total)
-        bloco = dados[r0:r1]
+def escrever_incremental(service, dest_id: str, sheet_title: str, dados: List[List[str]], extras=(),
+                         ao_gravar=None) -> bool:
+    """
+    Grava só os intervalos de linhas que mudaram (values.batchUpdate, junto com os extras) e limpa
+    apenas as linhas finais que não existem mais. Retorna False se o A:E já estava idêntico
+    (aí só os extras são gravados).
+    """
+    atual = ler_destino(service, dest_id, sheet_title)
+    blocos, sobra = diferencas(atual, dados)
+    if not blocos and not sobra:
+        reqs = gravar_plano(service, dest_id, sheet_title, [], extras) if extras else 0
+        registrar_economia(requisicoes_legadas(len(dados), WRITE_CHUNK), 1 + reqs)
+        return False
+
+    alteradas = sum(len(b) for _, b in blocos)
+    log(f"Incremental: {alteradas}/{len(dados)} linhas alteradas em {len(blocos)} intervalo(s), {sobra} linha(s) a remover")
+
+    reqs = 1  # leitura do A:E atual
+    if blocos and ensure_sheet_size(service, dest_id, sheet_title, min_rows=len(dados), min_cols=5):
+        reqs += 1
+    reqs += gravar_plano(service, dest_id, sheet_title, blocos, extras, ao_gravar)
+    if sobra:
+        limpar_sobra(service, dest_id, sheet_title, len(dados) + 1, len(atual))
+        reqs += 1
+    registrar_economia(requisicoes_legadas(len(dados), WRITE_CHUNK), reqs)
+    return True
+
+# ============== REPLICAÇÃO POR DESTINO ==============
+def _concluir(dest_id: str, h: str, hashes: Optional[Dict[str, str]], diario: Optional[dict],
+              drive=None, versoes: Optional[Dict[str, dict]] = None):
+    if hashes is not None:
+        hashes[dest_id] = h
+    if versoes is not None and drive is not None:
+        # versão do destino logo depois da nossa escrita: se mudar até a próxima execução, alguém mexeu nele
+        versoes[dest_id] = versao_drive(drive, dest_id, retry)
+    if diario is not None:
+        diario_concluido(diario, DIARIO_REPLICAR, dest_id, h)
+
+def replicar_destino(service, indice, aba_config: str, idx: int, filtro: str, dest_id: str,
+                     hashes: Optional[Dict[str, str]] = None, diario: Optional[dict] = None,
+                     drive=None, versoes: Optional[Dict[str, dict]] = None) -> bool:
+    """
+    Replica a fatia de um destino; erros ficam isolados no próprio destino (retorna False).
+    Com 'hashes' (estado da última execução) e 'versoes' (versão de cada destino no Drive depois da
+    nossa última escrita), dispensa a releitura do A:E se a fatia não mudou e ninguém editou o
+    destino desde então; o G2 é gravado de qualquer forma. Com 'diario', anota cada lote gravado e
+    o destino concluído (retomada após queda).
+    """
+    try:
+        filtro_show = filtro or "(vazio)"
+        log(f"Linha {idx} ({aba_config}): '{filtro_show}' → {dest_id}")
+
+        dados = fatia_do_indice(indice, filtro)
+        if not dados:
+            dados = [DEFAULT_HEADER[:]]
+
+        if not planilha_tem_aba(service, dest_id, ABA_DESTINO):
+            log(f"Aviso: {dest_id} sem aba '{ABA_DESTINO}'. Pulando.")
+            return False
+
+        # ========== TIMESTAMP G2 (horário Brasília) — vai no mesmo batchUpdate dos dados ==========
+        br_now = datetime.datetime.utcnow() - datetime.timedelta(hours=3)
+        timestamp = br_now.strftime("%d/%m/%Y %H:%M:%S")
+        extras = [(f"{ABA_DESTINO}!G2", [[timestamp]])]
+
+        h = hash_linhas(dados)
+        if (hashes is not None and hashes.get(dest_id) == h and versoes is not None and drive is not None
+                and versoes.get(dest_id) and versao_drive(drive, dest_id, retry) == versoes[dest_id]):
+            log(f"Fatia '{filtro_show}' igual à última replicada e destino sem edições desde então: só o G2.")
+            gravar_plano(service, dest_id, ABA_DESTINO, [], extras)
+            log(f"🕒 Timestamp gravado em {dest_id} → {ABA_DESTINO}!G2: {timestamp}")
+            _concluir(dest_id, h, hashes, diario, drive, versoes)
+            return True
 
-        retry(
-            lambda: service.spreadsheets().values().update(
-                spreadsheetId=dest_id,
-                range=f"{sheet_title}!A{r0+1}",
-                valueInputOption="USER_ENTERED",
-                body={"values": bloco}
-            ).execute(),
-            f"Escrever {dest_id}:{sheet_title} {r0+1}-{r1}"
-        )
-        enviados = r1
-        log(f"Gravado {enviados}/{total} no destino")
+        log(f"Filtrado: {max(0, len(dados)-1)} linhas (E == '{filtro_show}') – cabeçalho garantido")
+
+        anotar = None
+        if diario is not None:
+            anotar = lambda lote: diario_lote(diario, DIARIO_REPLICAR, dest_id, h, linhas_do_lote(lote))
+
+        if MODO_INCREMENTAL:
+            # a releitura do A:E já deixa de fora o que uma execução interrompida chegou a gravar
+            if not escrever_incremental(service, dest_id, ABA_DESTINO, dados, extras, anotar):
+                log("Destino já atualizado (A:E idêntico): só o G2.")
+        else:
+            parcial = diario_parcial(diario, dest_id, h) if diario is not None else None
+            escrever_destino(service, dest_id, ABA_DESTINO, dados, extras,
+                             parcial["feitos"] if parcial else (), anotar)
+        log(f"🕒 Timestamp gravado em {dest_id} → {ABA_DESTINO}!G2: {timestamp}")
+        _concluir(dest_id, h, hashes, diario, drive, versoes)
+        return True
+
+    except HttpError as he:
+        log(f"Erro API em {dest_id}: {he}")
+    except Exception as e:
+        log(f"Erro inesperado em {dest_id}: {e}")
+    return False
 
 # ============== MAIN ==============
-def main():
+def main(creds=None, service=None, fonte: Optional[List[List]] = None, unidades: Optional[set] = None):
+    """
+    Executa a replicação. No pipeline unificado recebe credenciais/serviço já autenticados e a
+    tabela BD_Esteira recém-gerada em 'fonte', dispensando a releitura da aba de origem.
+    Com 'unidades' (modo contínuo), só os destinos dessas unidades da coluna E são replicados,
+    além dos que ficaram pendentes (falha ou escrita interrompida).
+    """
     log("Iniciando replicação BD_Esteira → destinos (via Config!BH/BI)")
-    service = get_api()
-
-    aba_config = achar_aba_config(service)
-    pares = ler_pares_config(service, aba_config)
+    creds   = creds or get_credentials()
+    renovar_token(creds, log=log)
+    service = service or novo_servico(creds)
+
+    # Detecção de mudanças: versão da planilha origem no Drive + hash por destino da última execução
+    # (e, se a anterior caiu no meio, os destinos que ela chegou a concluir, anotados no diário)
+    estado, versao, hashes, diario, drive, versoes = {}, None, None, None, None, None
+    if DETECTAR_MUDANCAS:
+        estado = {} if FORCAR else carregar_json(ESTADO_REPLICAR)
+        diario = abrir_diario(DIARIO_REPLICAR)
+        drive  = novo_drive(creds)
+        with etapa("detecção de mudanças"):
+            versao = versao_drive(drive, ORIGEM_ID, retry)
+        if fonte is None and versao and estado.get("origem") == versao:
+            log(f"Origem sem alterações no Drive desde a última replicação ({versao.get('modifiedTime')}). Encerrando.")
+            return
+        hashes = {**estado.get("destinos", {}), **diario["concluidos"]}
+        versoes = dict(estado.get("versoes", {}))
+        if diario["concluidos"] or diario["parciais"]:
+            log(f"Retomando execução interrompida: {len(diario['concluidos'])} destino(s) já concluído(s), "
+                f"{len(diario['parciais'])} pela metade")
+
+    with etapa("configuração"):
+        aba_config = achar_aba_config(service)
+        pares = ler_pares_config(service, aba_config)
     if not pares:
         log("Nenhum destino encontrado em Config. Encerrando.")
         return
     log(f"Destinos detectados: {len(pares)}")
-
-    fonte = ler_esteira_origem(service)
+    ativos = {d for _, d in pares}
+    if unidades is not None:
+        pendentes = set(diario["parciais"]) if diario else set()
+        pares = [(f, d) for f, d in pares if (f or "").strip() in unidades or d in pendentes
+                 or (hashes is not None and d not in hashes)]
+        log(f"Unidades alteradas: {len(unidades)} → {len(pares)} destino(s) a replicar")
+
+    if fonte is None:
+        with etapa("leitura da fonte"):
+            fonte = ler_esteira_origem(service)
+    else:
+        log(f"Fonte recebida em memória ({ABA_FONTE} recém-gravada): releitura dispensada")
+        fonte = normalizar_fonte(fonte)
     if not fonte:
         log("Origem BD_Esteira vazia. Encerrando.")
         return
     tem_header = _tem_cabecalho_aparente(fonte[0]) if fonte else False
     log(f"Fonte carregada: {max(0, len(fonte)-(1 if tem_header else 0))} linhas + {'c/ cabeçalho' if tem_header else 's/ cabeçalho'}")
 
-    for idx, (filtro, dest_id) in enumerate(pares, start=START_ROW):
-        try:
-            filtro_show = filtro or "(vazio)"
-            log(f"Linha {idx} ({aba_config}): '{filtro_show}' → {dest_id}")
-
-            if not planilha_tem_aba(service, dest_id, ABA_DESTINO):
-                log(f"Aviso: {dest_id} sem aba '{ABA_DESTINO}'. Pulando.")
-                continue
-
-            dados = filtrar_por_col_E(fonte, filtro)
-            if not dados:
-                dados = [DEFAULT_HEADER[:]]
-
-            log(f"Filtrado: {max(0, len(dados)-1)} linhas (E == '{filtro_show}') – cabeçalho garantido")
-            limpar_destino(service, dest_id, ABA_DESTINO)
-            escrever_destino(service, dest_id, ABA_DESTINO, dados)
-
-            # ========== TIMESTAMP G2 (horário Brasília) ==========
-            br_now = datetime.datetime.utcnow() - datetime.timedelta(hours=3)
-            timestamp = br_now.strftime("%d/%m/%Y %H:%M:%S")
-            retry(
-                lambda: service.spreadsheets().values().update(
-                    spreadsheetId=dest_id,
-                    range=f"{ABA_DESTINO}!G2",
-                    valueInputOption="USER_ENTERED",
-                    body={"values": [[timestamp]]}
-                ).execute(),
-                f"Escrever timestamp em {dest_id}:{ABA_DESTINO}!G2"
-            )
-            log(f"🕒 Timestamp gravado em {dest_id} → {ABA_DESTINO}!G2: {timestamp}")
-
-        except HttpError as he:
-            log(f"Erro API em {dest_id}: {he}")
-        except Exception as e:
-            log(f"Erro inesperado em {dest_id}: {e}")
-
+    # índice único por coluna E: cada destino (inclusive filtros repetidos) pega sua fatia sem reprocessar a fonte
+    with etapa("índice"):
+        indice = indexar_por_col_E(fonte)
+    log(f"Índice por Unidade (E): {len(indice[1])} valores distintos")
+
+    def _replicar(srv, drv, idx, filtro, dest_id):
+        with etapa("destino", destino=dest_id):
+            ok = replicar_destino(srv, indice, aba_config, idx, filtro, dest_id, hashes, diario, drv, versoes)
+        if not ok and hashes is not None:
+            hashes.pop(dest_id, None)  # sem hash, o destino volta na próxima execução/ciclo
+            versoes.pop(dest_id, None)
+        return ok
+
+    tarefas = list(enumerate(pares, start=START_ROW))
+    if diario and diario["parciais"]:
+        # destino que ficou pela metade numa execução interrompida é terminado primeiro
+        tarefas.sort(key=lambda t: t[1][1] not in diario["parciais"])
+    if MAX_WORKERS <= 1:
+        resultados = [_replicar(service, drive, idx, filtro, dest_id) for idx, (filtro, dest_id) in tarefas]
+    else:
+        log(f"Replicando em paralelo (até {MAX_WORKERS} destinos simultâneos)")
+
+        def _worker(tarefa):
+            idx, (filtro, dest_id) = tarefa
+            _local.tag = dest_id
+            try:
+                return _replicar(cliente_da_thread(creds), cliente_da_thread(creds, "drive", "v3") if drive else None,
+                                 idx, filtro, dest_id)
+            finally:
+                _local.tag = None
+
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+            resultados = list(pool.map(_worker, tarefas))
+
+    log(f"Destinos replicados: {sum(resultados)}/{len(tarefas)}")
+
+    if DETECTAR_MUDANCAS:
+        # a versão só é registrada se todos os destinos ficaram em dia (senão a próxima execução tenta de novo)
+        novo_estado = {"destinos": {d: h for d, h in hashes.items() if d in ativos},
+                       "versoes": {d: v for d, v in versoes.items() if d in ativos and v}}
+        if all(resultados) and versao:
+            novo_estado["origem"] = versao
+        salvar_json(ESTADO_REPLICAR, novo_estado)
+        encerrar_diario(DIARIO_REPLICAR, diario, ativos)
+    log(f"Escrita: {resumo_economia()}")
     log("Concluído com sucesso.")
 
 if __name__ == "__main__":
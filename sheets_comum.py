@@ -0,0 +1,830 @@
+import atexit, contextlib, difflib, json, math, os, random, re, sys, threading, time, http.client, email.utils, urllib.parse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import httplib2
+from google.auth.exceptions import RefreshError, TransportError
+from googleapiclient.errors import HttpError
+
+# ============== EXECUÇÃO DE REQUISIÇÕES (cota, classificação de erros, orçamento de retries) ==============
+# As cotas do Sheets valem por minuto e por usuário (60 leituras e 60 escritas), além das do projeto
+# (300 + 300); a conta de serviço é um usuário só, então o teto de uma execução é o por usuário.
+COTA_POR_USUARIO  = int(os.getenv("SHEETS_COTA_POR_USUARIO", "60"))   # leituras/min e escritas/min da conta
+REQ_POR_MINUTO    = int(os.getenv("SHEETS_REQ_POR_MINUTO", str(COTA_POR_USUARIO)))  # ritmo de cada balde
+RAJADA_MAX        = max(1, REQ_POR_MINUTO // 10)                      # requisições liberadas de uma vez
+ORCAMENTO_RETRIES = int(os.getenv("SHEETS_ORCAMENTO_RETRIES", "20"))  # novas tentativas por destino/etapa
+ORCAMENTO_EXECUCAO = int(os.getenv("SHEETS_ORCAMENTO_EXECUCAO", "60"))  # teto de novas tentativas na execução inteira
+BACKOFF_MAX       = 90
+
+STATUS_RETENTAVEIS = {408, 429, 500, 502, 503, 504}
+ERROS_REDE = (OSError, http.client.HTTPException, httplib2.HttpLib2Error, TransportError)
+
+# um balde por cota (leitura e escrita são contadas à parte); chamadas ao Drive não gastam cota do Sheets
+_baldes = {tipo: {"tokens": float(RAJADA_MAX), "t": time.monotonic()} for tipo in ("leitura", "escrita")}
+_balde_lock = threading.Lock()
+_pausa = {"ate": 0.0}
+_orcamentos: Dict[str, int] = {}  # retries restantes por unidade de trabalho
+_orcamento_execucao = {"resta": ORCAMENTO_EXECUCAO}  # e na execução (numa queda geral, todas as unidades gastam dele)
+
+_metodos_leitura = ("sheets.spreadsheets.get", "sheets.spreadsheets.getByDataFilter", "sheets.spreadsheets.values.get",
+                    "sheets.spreadsheets.values.batchGet", "sheets.spreadsheets.values.batchGetByDataFilter")
+
+def tipo_cota(req) -> Optional[str]:
+    """Cota que a requisição consome: 'leitura', 'escrita' ou None (Drive). Sem methodId, conta como leitura."""
+    metodo = str(getattr(req, "methodId", "") or "")
+    if metodo.startswith("drive."):
+        return None
+    if not metodo or metodo in _metodos_leitura:
+        return "leitura"
+    return "escrita"
+
+def aguardar_cota(tipo: Optional[str] = "leitura"):
+    """Token bucket da cota 'tipo': espera até haver cota (e respeita pausas pedidas via 429)."""
+    taxa = REQ_POR_MINUTO / 60.0
+    while True:
+        with _balde_lock:
+            agora = time.monotonic()
+            espera = _pausa["ate"] - agora
+            if espera <= 0 and tipo is None:
+                return
+            if tipo is not None:
+                balde = _baldes[tipo]
+                balde["tokens"] = min(RAJADA_MAX, balde["tokens"] + (agora - balde["t"]) * taxa)
+                balde["t"] = agora
+                if espera <= 0 and balde["tokens"] >= 1:
+                    balde["tokens"] -= 1
+                    return
+                if espera <= 0:
+                    espera = (1 - balde["tokens"]) / taxa
+        time.sleep(espera)
+
+def reiniciar_cota():
+    """Baldes cheios e sem pausa (com REQ_POR_MINUTO/RAJADA_MAX atuais)."""
+    with _balde_lock:
+        for balde in _baldes.values():
+            balde.update(tokens=float(RAJADA_MAX), t=time.monotonic())
+        _pausa["ate"] = 0.0
+
+def status_http(e: Exception) -> Optional[int]:
+    if isinstance(e, HttpError):
+        return getattr(e.resp, "status", None)
+    return None
+
+def retentavel(e: Exception) -> bool:
+    """429/5xx/408, 403 de rate limit e falhas de rede valem nova tentativa; 400/401/403/404 etc. não."""
+    if isinstance(e, HttpError):
+        status = status_http(e)
+        if status in STATUS_RETENTAVEIS:
+            return True
+        conteudo = e.content.decode("utf-8", "replace") if isinstance(e.content, bytes) else str(e.content or "")
+        return status == 403 and ("rateLimitExceeded" in conteudo or "RATE_LIMIT_EXCEEDED" in conteudo)
+    return isinstance(e, ERROS_REDE)
+
+def retry_after(e: Exception) -> Optional[float]:
+    """Segundos pedidos pelo servidor no cabeçalho Retry-After (número ou data HTTP)."""
+    resp = getattr(e, "resp", None)
+    valor = resp.get("retry-after") if hasattr(resp, "get") else None
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        quando = email.utils.parsedate_to_datetime(valor)
+        return max(0.0, quando.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _unidade() -> str:
+    """Unidade de trabalho da thread para o orçamento de retries: o destino, senão a etapa."""
+    return getattr(_contexto, "destino", None) or getattr(_contexto, "etapa", None) or "execução"
+
+def consumir_orcamento() -> bool:
+    """Gasta 1 retry do orçamento da unidade de trabalho atual e do da execução; False se um deles acabou."""
+    unidade = _unidade()
+    with _balde_lock:
+        resta = _orcamentos.get(unidade, ORCAMENTO_RETRIES)
+        if resta <= 0 or _orcamento_execucao["resta"] <= 0:
+            return False
+        _orcamentos[unidade] = resta - 1
+        _orcamento_execucao["resta"] -= 1
+        return True
+
+def reiniciar_orcamento():
+    """Devolve os orçamentos de retries inteiros (no modo contínuo, cada ciclo conta como uma execução)."""
+    with _balde_lock:
+        _orcamentos.clear()
+        _orcamento_execucao["resta"] = ORCAMENTO_EXECUCAO
+
+def pausar_todos(segundos: float):
+    """Depois de um 429, segura todas as threads (não só a que levou o erro)."""
+    with _balde_lock:
+        _pausa["ate"] = max(_pausa["ate"], time.monotonic() + segundos)
+
+def executar(req, desc: str, log: Callable[[str], None] = print,
+             tentativas: int = 8, backoff: float = 3.0):
+    """
+    Executa a requisição (objeto com .execute(), ou uma função sem argumentos) sob o limitador
+    de cota. Erros fatais (400/403/404…) sobem na hora; retentáveis esperam Retry-After ou
+    backoff exponencial, até 'tentativas' ou até o orçamento de retries do destino/etapa (ou o da execução) acabar.
+    Requisições da API entram nas métricas da execução (uma entrada por chamada, com as tentativas).
+    """
+    chamar = req.execute if hasattr(req, "execute") else req
+    medida = req if hasattr(req, "execute") else None
+    tipo = tipo_cota(req)
+    inicio, ultimo = time.monotonic(), None
+    for att in range(1, tentativas + 1):
+        aguardar_cota(tipo)
+        t0 = time.monotonic()
+        try:
+            res = chamar()
+        except Exception as e:
+            latencia, ultimo = time.monotonic() - t0, e
+            if not retentavel(e):
+                registrar_chamada(medida, desc, inicio, latencia, att, erro=e)
+                log(f"❌ {desc} — erro definitivo (HTTP {status_http(e) or '-'}): {e}")
+                raise
+            if att == tentativas:
+                registrar_chamada(medida, desc, inicio, latencia, att, erro=e)
+                break
+            if not consumir_orcamento():
+                registrar_chamada(medida, desc, inicio, latencia, att, erro=e)
+                raise RuntimeError(f"❌ {desc} — orçamento de retries esgotado ({ORCAMENTO_RETRIES} por '{_unidade()}', {ORCAMENTO_EXECUCAO} na execução): {e}") from e
+            pedido = retry_after(e)
+            wait = min(BACKOFF_MAX, pedido if pedido is not None else backoff*(2**(att-1)) + random.uniform(0,1.5))
+            if status_http(e) == 429:
+                pausar_todos(wait)
+            log(f"⚠️ {desc} — tentativa {att}/{tentativas} falhou: {e} | aguardando {round(wait,1)}s")
+            time.sleep(wait)
+        else:
+            _contexto.ultima_latencia = time.monotonic() - t0  # só a ida à API (sem espera de cota/backoff)
+            registrar_chamada(medida, desc, inicio, _contexto.ultima_latencia, att, resposta=res)
+            return res
+    raise RuntimeError(f"❌ {desc} — falhou após {tentativas} tentativas.") from ultimo
+
+def medir(req, desc: str = ""):
+    """Uma única execução, sem cota nem retry (para quem trata as próprias falhas), registrada nas métricas."""
+    t0 = time.monotonic()
+    try:
+        res = req.execute()
+    except Exception as e:
+        registrar_chamada(req, desc, t0, time.monotonic() - t0, 1, erro=e)
+        raise
+    registrar_chamada(req, desc, t0, time.monotonic() - t0, 1, resposta=res)
+    return res
+
+# ============== MÉTRICAS DA EXECUÇÃO ==============
+# Cada chamada à API (operação, planilha, intervalo, latência, bytes, status, tentativas) e cada
+# etapa cronometrada (leitura, transformação, escrita, limpeza, destino…) ficam em memória; ao fim
+# do processo vão para um JSON e, no GitHub Actions, para um resumo em Markdown do job.
+METRICAS_ARQUIVO = os.getenv("BD_ESTEIRA_METRICAS", "metricas_execucao.json")  # "" = não grava
+TOP_RESUMO       = 10           # linhas por tabela no resumo em Markdown
+
+_metricas: Dict[str, list] = {"chamadas": [], "etapas": []}
+_metricas_lock = threading.Lock()
+_contexto = threading.local()   # etapa/destino atuais da thread (rotulam as chamadas)
+_t0_execucao = time.monotonic()
+_emissao_agendada = False
+
+_re_planilha = re.compile(r"/(?:spreadsheets|files)/([^/:?]+)")
+
+def descrever_requisicao(req) -> Tuple[str, str, str, int]:
+    """(operação, planilha, intervalo, bytes enviados) a partir de methodId/uri/body da requisição."""
+    op = str(getattr(req, "methodId", "") or "")
+    op = op[len("sheets."):] if op.startswith("sheets.") else op
+    url = urllib.parse.urlsplit(str(getattr(req, "uri", "") or ""))
+    m = _re_planilha.search(url.path)
+    planilha = urllib.parse.unquote(m.group(1)) if m else ""
+
+    intervalos = []
+    if "/values/" in url.path:
+        intervalos.append(urllib.parse.unquote(url.path.split("/values/", 1)[1].split(":", 1)[0]))
+    intervalos += urllib.parse.parse_qs(url.query).get("ranges", [])
+    body = getattr(req, "body", None)
+    enviados = 0
+    if body:
+        if isinstance(body, (str, bytes)):
+            enviados = len(body)
+            try:
+                body = json.loads(body)
+            except ValueError:
+                body = {}
+        else:
+            enviados = tamanho_json(body)
+        if isinstance(body, dict):
+            intervalos += [d.get("range", "") for d in body.get("data", []) if isinstance(d, dict)]
+            intervalos += [r for r in body.get("ranges", []) if isinstance(r, str)]
+    intervalo = intervalos[0] if intervalos else ""
+    if len(intervalos) > 1:
+        intervalo += f" (+{len(intervalos) - 1})"
+    return op, planilha, intervalo, enviados
+
+def registrar_chamada(req, desc: str, inicio: float, latencia: float, tentativas: int,
+                      resposta=None, erro: Optional[Exception] = None):
+    """Guarda uma chamada concluída (com sucesso ou não); funções sem requisição não são registradas."""
+    if req is None:
+        return
+    op, planilha, intervalo, enviados = descrever_requisicao(req)
+    if erro is None:
+        status = 200
+    else:
+        status = status_http(erro) or type(erro).__name__
+    registro = {
+        "op": op, "planilha": planilha, "intervalo": intervalo, "desc": desc,
+        "etapa": getattr(_contexto, "etapa", None), "destino": getattr(_contexto, "destino", None),
+        "inicio_s": round(inicio - _t0_execucao, 3),
+        "latencia_s": round(latencia, 3),
+        "total_s": round(time.monotonic() - inicio, 3),
+        "bytes_enviados": enviados,
+        "bytes_resposta": tamanho_json(resposta) if resposta is not None else 0,
+        "status": status, "tentativas": tentativas,
+    }
+    with _metricas_lock:
+        _metricas["chamadas"].append(registro)
+    _agendar_emissao()
+
+@contextlib.contextmanager
+def etapa(nome: str, destino: Optional[str] = None, registrar: bool = True):
+    """
+    Cronometra um trecho como etapa 'nome' (somada no resumo) e rotula as chamadas feitas nele.
+    destino herda o da etapa externa; registrar=False só rotula (ex.: threads de leitura paralela).
+    """
+    anterior = (getattr(_contexto, "etapa", None), getattr(_contexto, "destino", None))
+    _contexto.etapa = nome
+    _contexto.destino = destino if destino is not None else anterior[1]
+    t0 = time.monotonic()
+    try:
+        yield
+    finally:
+        if registrar:
+            with _metricas_lock:
+                _metricas["etapas"].append({
+                    "etapa": nome, "destino": _contexto.destino,
+                    "inicio_s": round(t0 - _t0_execucao, 3),
+                    "duracao_s": round(time.monotonic() - t0, 3),
+                })
+            _agendar_emissao()
+        _contexto.etapa, _contexto.destino = anterior
+
+def cronometrar(itens, nome: str):
+    """Repassa os itens de um gerador contando como etapa 'nome' só o tempo gasto para produzi-los."""
+    it = iter(itens)
+    while True:
+        with etapa(nome):
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+        yield item
+
+def reiniciar_metricas():
+    """Zera as métricas (benchmarks com vários cenários, ciclos do modo contínuo)."""
+    global _t0_execucao
+    with _metricas_lock:
+        _metricas["chamadas"].clear()
+        _metricas["etapas"].clear()
+        _t0_execucao = time.monotonic()
+    with _conexoes_lock:
+        _conexoes.update(novas=0, reusadas=0, gzip=0)
+
+def resumo_metricas() -> dict:
+    """Agregados da execução: totais, tempo por etapa, destinos mais lentos, operações e pontos de retry."""
+    with _metricas_lock:
+        chamadas = list(_metricas["chamadas"])
+        etapas = list(_metricas["etapas"])
+
+    por_etapa = defaultdict(lambda: {"duracao_s": 0.0, "vezes": 0})
+    por_destino = defaultdict(lambda: {"duracao_s": 0.0, "chamadas": 0, "falhas": 0})
+    for e in etapas:
+        por_etapa[e["etapa"]]["duracao_s"] += e["duracao_s"]
+        por_etapa[e["etapa"]]["vezes"] += 1
+        if e["etapa"] == "destino" and e["destino"]:
+            por_destino[e["destino"]]["duracao_s"] += e["duracao_s"]
+
+    por_op = defaultdict(lambda: {"chamadas": 0, "latencia_s": 0.0, "max_s": 0.0, "bytes_resposta": 0, "falhas": 0})
+    retries = defaultdict(lambda: {"chamadas": 0, "falhas": 0, "status": set()})
+    for c in chamadas:
+        falhas = c["tentativas"] - 1 + (0 if c["status"] == 200 else 1)
+        o = por_op[c["op"]]
+        o["chamadas"] += 1
+        o["latencia_s"] += c["latencia_s"]
+        o["max_s"] = max(o["max_s"], c["latencia_s"])
+        o["bytes_resposta"] += c["bytes_resposta"]
+        o["falhas"] += falhas
+        if c["destino"]:
+            por_destino[c["destino"]]["chamadas"] += 1
+            por_destino[c["destino"]]["falhas"] += falhas
+        if falhas:
+            r = retries[(c["op"], c["planilha"], c["etapa"] or "")]
+            r["chamadas"] += 1
+            r["falhas"] += falhas
+            if c["status"] != 200:
+                r["status"].add(str(c["status"]))
+
+    return {
+        "duracao_s": round(time.monotonic() - _t0_execucao, 3),
+        "conexoes": estatisticas_conexoes(),
+        "chamadas": len(chamadas),
+        "falhas": sum(o["falhas"] for o in por_op.values()),
+        "bytes_enviados": sum(c["bytes_enviados"] for c in chamadas),
+        "bytes_resposta": sum(c["bytes_resposta"] for c in chamadas),
+        "etapas": {k: {"duracao_s": round(v["duracao_s"], 3), "vezes": v["vezes"]}
+                   for k, v in sorted(por_etapa.items(), key=lambda kv: -kv[1]["duracao_s"])},
+        "operacoes": {k: {**v, "latencia_s": round(v["latencia_s"], 3), "max_s": round(v["max_s"], 3)}
+                      for k, v in sorted(por_op.items(), key=lambda kv: -kv[1]["latencia_s"])},
+        "destinos_mais_lentos": [{"destino": k, **v, "duracao_s": round(v["duracao_s"], 3)}
+                                 for k, v in sorted(por_destino.items(), key=lambda kv: -kv[1]["duracao_s"])[:TOP_RESUMO]],
+        "pontos_de_retry": [{"op": op, "planilha": pl, "etapa": et, "chamadas": v["chamadas"], "falhas": v["falhas"],
+                             "status": sorted(v["status"])}
+                            for (op, pl, et), v in sorted(retries.items(), key=lambda kv: -kv[1]["falhas"])[:TOP_RESUMO]],
+    }
+
+def markdown_metricas(resumo: dict, titulo: str) -> str:
+    """Resumo legível para o $GITHUB_STEP_SUMMARY."""
+    mb = lambda b: f"{b / 2**20:.1f}"
+    md = [f"### {titulo}", "",
+          f"**{resumo['duracao_s']:.1f}s** · {resumo['chamadas']} chamadas à API · "
+          f"{mb(resumo['bytes_enviados'])} MB enviados · {mb(resumo['bytes_resposta'])} MB recebidos · "
+          f"{resumo['falhas']} tentativa(s) com falha", ""]
+    con = resumo.get("conexoes") or {}
+    if con.get("requisicoes"):
+        md += [f"Conexões HTTP: {con['novas']} abertas, {con['reusadas']} reaproveitadas "
+               f"({con['reuso_pct']:.0f}% de reuso) · {con['gzip']} resposta(s) em gzip", ""]
+    if resumo["etapas"]:
+        md += ["| Etapa | Tempo (s) | Vezes |", "|---|---:|---:|"]
+        md += [f"| {k} | {v['duracao_s']:.1f} | {v['vezes']} |" for k, v in resumo["etapas"].items()]
+        md += ["", "_Etapas em threads paralelas somam os tempos de cada thread._", ""]
+    if resumo["operacoes"]:
+        md += ["| Operação | Chamadas | Latência total (s) | Máx (s) | MB recebidos | Falhas |",
+               "|---|---:|---:|---:|---:|---:|"]
+        md += [f"| `{k}` | {v['chamadas']} | {v['latencia_s']:.1f} | {v['max_s']:.2f} | {mb(v['bytes_resposta'])} | {v['falhas']} |"
+               for k, v in resumo["operacoes"].items()]
+        md.append("")
+    if resumo["destinos_mais_lentos"]:
+        md += ["#### Destinos mais lentos", "", "| Destino | Tempo (s) | Chamadas | Falhas |", "|---|---:|---:|---:|"]
+        md += [f"| `{d['destino']}` | {d['duracao_s']:.1f} | {d['chamadas']} | {d['falhas']} |"
+               for d in resumo["destinos_mais_lentos"]]
+        md.append("")
+    if resumo["pontos_de_retry"]:
+        md += ["#### Pontos de retry", "", "| Operação | Planilha | Etapa | Chamadas | Falhas | Status final |",
+               "|---|---|---|---:|---:|---|"]
+        md += [f"| `{r['op']}` | `{r['planilha']}` | {r['etapa'] or '-'} | {r['chamadas']} | {r['falhas']} | "
+               f"{', '.join(r['status']) or 'ok'} |" for r in resumo["pontos_de_retry"]]
+        md.append("")
+    return "\n".join(md) + "\n"
+
+def emitir_metricas(titulo: Optional[str] = None):
+    """Grava o JSON de métricas (METRICAS_ARQUIVO) e anexa o resumo ao $GITHUB_STEP_SUMMARY, se houver."""
+    with _metricas_lock:
+        if not _metricas["chamadas"] and not _metricas["etapas"]:
+            return
+        dados = {"chamadas": list(_metricas["chamadas"]), "etapas": list(_metricas["etapas"])}
+    titulo = titulo or f"Métricas — {os.path.basename(sys.argv[0] or 'execução')}"
+    resumo = resumo_metricas()
+    if METRICAS_ARQUIVO:
+        with open(METRICAS_ARQUIVO, "w", encoding="utf-8") as f:
+            json.dump({"titulo": titulo, "resumo": resumo, **dados}, f, ensure_ascii=False, indent=1)
+    destino_md = os.getenv("GITHUB_STEP_SUMMARY")
+    if destino_md:
+        with open(destino_md, "a", encoding="utf-8") as f:
+            f.write(markdown_metricas(resumo, titulo))
+
+def _agendar_emissao():
+    """Na primeira métrica registrada, agenda a emissão para o fim do processo (inclusive em erro)."""
+    global _emissao_agendada
+    if not _emissao_agendada:
+        _emissao_agendada = True
+        atexit.register(emitir_metricas)
+
+# ============== CLIENTES DA API (partida rápida) ==============
+# O build() do googleapiclient gera, a cada recurso criado (service.spreadsheets(), .values()…), as
+# docstrings de todos os métodos a partir dos schemas do discovery: ~0,2 s no 1º recurso de cada
+# serviço e ~30 ms nos seguintes. Aqui os clientes saem do documento embutido na biblioteca
+# (static_discovery), lido uma vez por processo, com os schemas reduzidos a stubs — só as
+# docstrings dependem deles; URLs, parâmetros e corpos das requisições ficam idênticos.
+DISCOVERY_ENXUTO = os.getenv("SHEETS_DISCOVERY_ENXUTO", "1") not in ("0", "false", "False")
+
+_documentos: Dict[Tuple[str, str], Optional[str]] = {}
+_documentos_lock = threading.Lock()
+_token_lock = threading.Lock()
+
+def documento_discovery(api: str, versao: str) -> Optional[str]:
+    """Documento de discovery embutido, sem os schemas (JSON); None se a biblioteca não o trouxer."""
+    with _documentos_lock:
+        if (api, versao) not in _documentos:
+            from googleapiclient import discovery_cache
+            bruto = discovery_cache.get_static_doc(api, versao)
+            if bruto is not None:
+                doc = json.loads(bruto)
+                doc["schemas"] = {nome: {"id": nome, "type": "object"} for nome in doc.get("schemas", {})}
+                bruto = json.dumps(doc)
+            _documentos[(api, versao)] = bruto
+        return _documentos[(api, versao)]
+
+def construir_servico(api: str, versao: str, http):
+    """Equivalente a build(api, versao, http=http), sem buscar nem reprocessar o discovery a cada cliente."""
+    from googleapiclient.discovery import build, build_from_document
+    doc = documento_discovery(api, versao) if DISCOVERY_ENXUTO else None
+    if doc is None:
+        return build(api, versao, http=http)
+    return build_from_document(doc, http=http)  # recebe o texto: o build altera o dict que recebe
+
+def renovar_token(creds, timeout: int = 60, log: Callable[[str], None] = print):
+    """
+    Garante um access token válido antes de abrir clientes/threads: todos os clientes compartilham
+    o mesmo objeto de credenciais, então o token é obtido uma vez e reaproveitado pelas etapas
+    enquanto valer (o google-auth renova sozinho perto de expirar). Credencial recusada (RefreshError)
+    sobe na hora; falha de rede só é registrada, e a 1ª requisição renova de novo sob o retry de executar.
+    """
+    if creds is None or not hasattr(creds, "refresh"):
+        return
+    with _token_lock:
+        if not getattr(creds, "valid", False):
+            import google_auth_httplib2
+            try:
+                creds.refresh(google_auth_httplib2.Request(httplib2.Http(timeout=timeout)))
+            except RefreshError as e:
+                log(f"❌ Autenticação recusada ao obter o token: {e}")
+                raise
+            except Exception as e:
+                log(f"⚠️ Falha ao obter o token ({e}); nova tentativa na 1ª requisição")
+
+# ============== TRANSPORTE HTTP ==============
+# Fábrica comum dos clientes: um httplib2.Http por cliente (cada thread cria o seu, httplib2 não é
+# thread-safe) que fica aberto entre as requisições (keep-alive), então o handshake TLS só acontece
+# na 1ª chamada de cada thread. As respostas já vêm em gzip: o googleapiclient manda Accept-Encoding
+# e "(gzip)" no User-Agent, e o httplib2 descomprime. O timeout vale por operação de socket
+# (conexão/leitura), e não pela requisição inteira.
+TIMEOUT_HTTP = int(os.getenv("SHEETS_TIMEOUT_HTTP", "120"))
+
+_conexoes = {"novas": 0, "reusadas": 0, "gzip": 0}
+_conexoes_lock = threading.Lock()
+
+class _HttpPersistente(httplib2.Http):
+    """httplib2.Http que conta conexões abertas x reaproveitadas e respostas comprimidas."""
+
+    def _conn_request(self, conn, request_uri, method, body, headers):
+        nova = conn.sock is None
+        resposta, conteudo = super()._conn_request(conn, request_uri, method, body, headers)
+        with _conexoes_lock:
+            _conexoes["novas" if nova else "reusadas"] += 1
+            if resposta.get("-content-encoding") == "gzip":
+                _conexoes["gzip"] += 1
+        return resposta, conteudo
+
+def novo_http(creds, timeout: Optional[int] = None):
+    """Http persistente autorizado com as credenciais (um por cliente/thread)."""
+    import google_auth_httplib2
+    return google_auth_httplib2.AuthorizedHttp(creds, http=_HttpPersistente(timeout=timeout or TIMEOUT_HTTP))
+
+def novo_cliente(creds, api: str = "sheets", versao: str = "v4", timeout: Optional[int] = None):
+    """Cliente do Sheets (ou Drive) dos dois scripts: transporte persistente + discovery enxuto."""
+    return construir_servico(api, versao, novo_http(creds, timeout))
+
+_clientes_thread = threading.local()
+
+def cliente_da_thread(creds, api: str = "sheets", versao: str = "v4"):
+    """
+    Cliente (api, versao) da thread atual, criado na primeira chamada e reaproveitado depois: cada
+    thread fica com a sua conexão persistente (httplib2 não é thread-safe). Outras credenciais, outro cliente.
+    """
+    clientes = getattr(_clientes_thread, "clientes", None)
+    if clientes is None:
+        clientes = _clientes_thread.clientes = {}
+    dono, cliente = clientes.get((api, versao), (None, None))
+    if cliente is None or dono is not creds:
+        cliente = novo_cliente(creds, api, versao)
+        clientes[(api, versao)] = (creds, cliente)
+    return cliente
+
+def estatisticas_conexoes() -> dict:
+    """Requisições HTTP em conexão nova x reaproveitada e quantas respostas vieram comprimidas."""
+    with _conexoes_lock:
+        c = dict(_conexoes)
+    total = c["novas"] + c["reusadas"]
+    return {**c, "requisicoes": total, "reuso_pct": round(100 * c["reusadas"] / total, 1) if total else 0.0}
+
+def col_letter_to_index(letter: str) -> int:
+    n = 0
+    for ch in letter.strip().upper():
+        n = n * 26 + (ord(ch) - ord('A') + 1)
+    return n
+
+def index_to_col_letter(n: int) -> str:
+    s = ""
+    while n > 0:
+        n, r = divmod(n - 1, 26)
+        s = chr(ord('A') + r) + s
+    return s
+
+# ============== PLANEJADOR DE ESCRITA ==============
+# Junta blocos de linhas + células avulsas (ex.: timestamp G2) no menor número de
+# values.batchUpdate, quebrando só quando o corpo JSON passa do orçamento de bytes.
+# O orçamento se ajusta durante a execução: cresce enquanto os lotes voltam rápido,
+# encolhe com lotes lentos e cai pela metade quando um lote falha.
+LIMITE_PAYLOAD = 2_000_000  # teto de bytes por requisição (recomendação do Sheets: ~2 MB)
+LIMITE_MIN     = 128_000    # piso do orçamento adaptativo
+LIMITE_INICIAL = int(os.getenv("SHEETS_LIMITE_ESCRITA", "1000000"))
+ALVO_LATENCIA_ESCRITA = 10.0  # s por lote; acima disso o orçamento encolhe
+
+_limite = {"bytes": float(min(LIMITE_PAYLOAD, max(LIMITE_MIN, LIMITE_INICIAL)))}
+_limite_lock = threading.Lock()
+
+def limite_escrita() -> int:
+    """Orçamento de bytes atual por values.batchUpdate."""
+    with _limite_lock:
+        return int(_limite["bytes"])
+
+def ajustar_limite_escrita(latencia: Optional[float]):
+    """Sucesso rápido: +25%; lento (> ALVO_LATENCIA_ESCRITA): -25%; falha (latencia=None): metade."""
+    with _limite_lock:
+        atual = _limite["bytes"]
+        if latencia is None:
+            atual /= 2
+        elif latencia > ALVO_LATENCIA_ESCRITA:
+            atual *= 0.75
+        else:
+            atual *= 1.25
+        _limite["bytes"] = min(LIMITE_PAYLOAD, max(LIMITE_MIN, atual))
+
+def tamanho_json(obj) -> int:
+    return len(json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+def planejar_escrita(aba: str,
+                     blocos: Sequence[Tuple[int, List[List]]],
+                     extras: Sequence[Tuple[str, List[List]]] = (),
+                     limite: Optional[int] = None) -> List[List[dict]]:
+    """
+    blocos: [(linha inicial 1-based, linhas)] gravados a partir da coluna A da aba.
+    extras: [(range A1 completo, values)] — vão no primeiro lote.
+    limite: bytes por lote (padrão: orçamento adaptativo atual, limite_escrita()).
+    Retorna a lista de lotes; cada lote é o campo "data" de um values.batchUpdate.
+    """
+    limite = limite or limite_escrita()
+    lotes: List[List[dict]] = []
+    atual: List[dict] = [{"range": rng, "values": vals} for rng, vals in extras]
+    usado = sum(tamanho_json(d) for d in atual)
+
+    for r0, linhas in blocos:
+        ini, pendentes = r0, []
+        for linha in linhas:
+            custo = tamanho_json(linha) + 1
+            if usado + custo > limite and (pendentes or atual):
+                if pendentes:
+                    atual.append({"range": f"{aba}!A{ini}", "values": pendentes})
+                    ini += len(pendentes)
+                lotes.append(atual)
+                atual, pendentes, usado = [], [], 0
+            if not pendentes:
+                usado += 64  # range + chaves do ValueRange
+            pendentes.append(linha)
+            usado += custo
+        if pendentes:
+            atual.append({"range": f"{aba}!A{ini}", "values": pendentes})
+    if atual:
+        lotes.append(atual)
+    return lotes
+
+def linhas_do_lote(lote: List[dict]) -> List[Tuple[int, int]]:
+    """[(linha inicial 1-based, nº de linhas)] gravados pelo lote (os extras, fora da coluna A, não contam)."""
+    feitos = []
+    for d in lote:
+        m = re.search(r"!A(\d+)$", d.get("range", ""))
+        if m and d.get("values"):
+            feitos.append((int(m.group(1)), len(d["values"])))
+    return feitos
+
+def descontar_feitos(blocos: Sequence[Tuple[int, List[List]]],
+                     feitos: Sequence[Tuple[int, int]]) -> List[Tuple[int, List[List]]]:
+    """Tira de 'blocos' [(linha inicial 1-based, linhas)] as linhas já gravadas em 'feitos'."""
+    gravadas = set()
+    for ini, n in feitos:
+        gravadas.update(range(ini, ini + n))
+    restantes = []
+    for r0, linhas in blocos:
+        ini, pendentes = None, []
+        for k, linha in enumerate(linhas):
+            if r0 + k in gravadas:
+                if pendentes:
+                    restantes.append((ini, pendentes))
+                ini, pendentes = None, []
+                continue
+            if ini is None:
+                ini = r0 + k
+            pendentes.append(linha)
+        if pendentes:
+            restantes.append((ini, pendentes))
+    return restantes
+
+# ============== COMPARAÇÃO DE LINHAS (escrita incremental / delta) ==============
+def texto_local(v):
+    """Célula de coluna de texto lida sem formatação → texto, como no formato automático pt-BR."""
+    if isinstance(v, bool):
+        return "TRUE" if v else "FALSE"
+    if isinstance(v, float) and v.is_integer():
+        v = int(v)
+    if isinstance(v, (int, float)):
+        return str(v).replace(".", ",")
+    return v
+
+def celula_igual(novo, atual) -> bool:
+    """
+    Compara a célula nova com a lida do destino (sem formatação, UNFORMATTED_VALUE): números batem
+    com outro número de mesmo valor; o resto, pelo texto. Número contra texto nunca bate (regrava).
+    """
+    if isinstance(novo, (int, float)) and not isinstance(novo, bool):
+        return isinstance(atual, (int, float)) and not isinstance(atual, bool) and float(atual) == float(novo)
+    return str(novo) == str(atual)
+
+def linhas_iguais(atual: List, novo: List, largura: int = 5) -> bool:
+    a = (list(atual) + [""]*largura)[:largura]
+    n = (list(novo) + [""]*largura)[:largura]
+    return all(celula_igual(x, y) for x, y in zip(n, a))
+
+def _blocos_contiguos(novo: List[List], indices: Sequence[int]) -> List[Tuple[int, List[List]]]:
+    """Índices 0-based (crescentes) de 'novo' → [(linha inicial 1-based, linhas contíguas)]."""
+    blocos: List[Tuple[int, List[List]]] = []
+    inicio = anterior = None
+    for i in indices:
+        if inicio is not None and i != anterior + 1:
+            blocos.append((inicio + 1, novo[inicio:anterior + 1]))
+            inicio = None
+        if inicio is None:
+            inicio = i
+        anterior = i
+    if inicio is not None:
+        blocos.append((inicio + 1, novo[inicio:anterior + 1]))
+    return blocos
+
+def diferencas(atual: List[List], novo: List[List], largura: int = 5) -> Tuple[List[Tuple[int, List[List]]], int]:
+    """
+    Compara, posição a posição, o conteúdo atual do destino com o novo.
+    Retorna ([(linha inicial 1-based, linhas alteradas contíguas)], linhas que sobram no fim do destino).
+    """
+    alteradas = [i for i, r in enumerate(novo) if not (i < len(atual) and linhas_iguais(atual[i], r, largura))]
+    return _blocos_contiguos(novo, alteradas), max(0, len(atual) - len(novo))
+
+def _chave(linha: List, col: int) -> str:
+    v = str(linha[col] if len(linha) > col else "").strip()
+    # linha sem chave só casa com outra idêntica
+    return v if v else "\x00" + json.dumps(list(linha), ensure_ascii=False, default=str)
+
+def delta_por_chave(atual: List[List], novo: List[List], col_chave: int = 0, largura: int = 5,
+                    cabecalho: int = 1) -> dict:
+    """
+    Delta linha a linha pela chave (coluna col_chave), mantendo a ordem de 'novo'.
+    As linhas são alinhadas por chave (difflib); inserções/remoções no meio viram deslocamentos
+    de células, e só as linhas novas ou alteradas precisam ser gravadas. Retorna:
+      estrutura: [("inserir"|"remover", linha 0-based, quantidade)], de baixo para cima — aplicada em
+                 ordem, cada índice ainda se refere a 'atual'
+      blocos:    [(linha inicial 1-based, linhas)] a gravar depois dos deslocamentos
+      inseridos / removidos / alterados: contagem por chave, sem as 'cabecalho' primeiras linhas;
+      regravadas: linhas em 'blocos'
+    """
+    ka = [_chave(r, col_chave) for r in atual]
+    kn = [_chave(r, col_chave) for r in novo]
+    estrutura, gravar = [], []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, ka, kn, autojunk=False).get_opcodes():
+        if tag == "equal":
+            gravar.extend(j1 + k for k in range(i2 - i1) if not linhas_iguais(atual[i1 + k], novo[j1 + k], largura))
+            continue
+        n_atual, n_novo = i2 - i1, j2 - j1
+        if n_novo > n_atual:
+            estrutura.append(("inserir", i1 + n_atual, n_novo - n_atual))
+        elif n_atual > n_novo:
+            estrutura.append(("remover", i1 + n_novo, n_atual - n_novo))
+        gravar.extend(range(j1, j2))
+    estrutura.reverse()
+
+    por_chave_atual = {}
+    for k, r in zip(ka[cabecalho:], atual[cabecalho:]):
+        por_chave_atual.setdefault(k, r)
+    chaves_novas = set(kn[cabecalho:])
+    vistos, alterados = set(), 0
+    for k, r in zip(kn[cabecalho:], novo[cabecalho:]):
+        if k in por_chave_atual and k not in vistos:
+            vistos.add(k)
+            alterados += not linhas_iguais(por_chave_atual[k], r, largura)
+    return {
+        "estrutura": estrutura,
+        "blocos": _blocos_contiguos(novo, gravar),
+        "inseridos": len(chaves_novas - por_chave_atual.keys()),
+        "removidos": len(por_chave_atual.keys() - chaves_novas),
+        "alterados": alterados,
+        "regravadas": len(gravar),
+    }
+
+# ============== GRAVAÇÃO DOS LOTES (paralela, com divisão em caso de falha) ==============
+ESCRITA_PARALELA = int(os.getenv("SHEETS_ESCRITA_PARALELA", "3"))  # lotes da mesma aba gravados ao mesmo tempo
+TENTATIVAS_ANTES_DE_DIVIDIR = 2   # um lote que falha isso tudo é dividido ao meio em vez de reenviado inteiro
+
+_re_celula_inicial = re.compile(r"^(.*!)?([A-Z]+)(\d+)$")
+_pool_escrita: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def dividir_lote(lote: List[dict]) -> Optional[Tuple[List[dict], List[dict]]]:
+    """Metade dos ValueRanges para cada lado, ou metade das linhas de um ValueRange único; None se indivisível."""
+    if len(lote) > 1:
+        meio = len(lote) // 2
+        return lote[:meio], lote[meio:]
+    vr = lote[0]
+    linhas = vr.get("values", [])
+    m = _re_celula_inicial.match(vr.get("range", ""))
+    if len(linhas) < 2 or not m:
+        return None
+    meio = len(linhas) // 2
+    prefixo, col, lin = m.group(1) or "", m.group(2), int(m.group(3))
+    return ([{**vr, "values": linhas[:meio]}],
+            [{**vr, "range": f"{prefixo}{col}{lin + meio}", "values": linhas[meio:]}])
+
+def _causa(e: BaseException) -> BaseException:
+    """Erro original por trás do RuntimeError de executar (tentativas ou orçamento esgotados)."""
+    return e.__cause__ if isinstance(e, RuntimeError) and e.__cause__ is not None else e
+
+def _resta_orcamento() -> bool:
+    with _balde_lock:
+        return _orcamentos.get(_unidade(), ORCAMENTO_RETRIES) > 0 and _orcamento_execucao["resta"] > 0
+
+def _divisivel(e: BaseException) -> bool:
+    """Falhas que um lote menor pode resolver: timeout/rede/5xx ou payload grande demais (429 não: é cota)."""
+    causa = _causa(e)
+    status = status_http(causa)
+    if isinstance(causa, HttpError):
+        texto = causa.content.decode("utf-8", "replace") if isinstance(causa.content, bytes) else str(causa.content or "")
+        if status == 413 or (status == 400 and "payload" in texto.lower()):
+            return True
+    return status not in (429, 403) and retentavel(causa) and _resta_orcamento()
+
+def _gravar_lote(nova_requisicao: Callable[[List[dict]], object], lote: List[dict], desc: str,
+                 log: Callable[[str], None], tentativas: int, backoff: float,
+                 ao_gravar: Optional[Callable[[List[dict]], None]] = None) -> int:
+    """Grava um lote; se falhar de um jeito que lote menor resolve, divide ao meio e grava as partes."""
+    partes = dividir_lote(lote)
+    try:
+        executar(nova_requisicao(lote), desc, log,
+                 tentativas=TENTATIVAS_ANTES_DE_DIVIDIR if partes else tentativas, backoff=backoff)
+    except Exception as e:
+        if partes and _divisivel(e):
+            ajustar_limite_escrita(None)
+            log(f"✂️ {desc} — dividindo o lote ({tamanho_json(lote)} bytes) em 2 e gravando as metades")
+            return 1 + sum(_gravar_lote(nova_requisicao, p, f"{desc} [{i}/2]", log, tentativas, backoff, ao_gravar)
+                           for i, p in enumerate(partes, start=1))
+        if not (partes and retentavel(_causa(e)) and _resta_orcamento()):
+            raise
+        # cota (429): dividir só geraria mais requisições — segue com as tentativas restantes
+        executar(nova_requisicao(lote), desc, log,
+                 tentativas=max(1, tentativas - TENTATIVAS_ANTES_DE_DIVIDIR), backoff=backoff)
+    ajustar_limite_escrita(_contexto.ultima_latencia)
+    if ao_gravar:
+        ao_gravar(lote)
+    return 1
+
+def gravar_lotes(nova_requisicao: Callable[[List[dict]], object], lotes: List[List[dict]], desc: str,
+                 log: Callable[[str], None] = print, paralelo: bool = False,
+                 tentativas: int = 8, backoff: float = 3.0,
+                 ao_gravar: Optional[Callable[[List[dict]], None]] = None) -> int:
+    """
+    Grava os lotes de planejar_escrita. nova_requisicao(lote) monta o values.batchUpdate e, com
+    paralelo=True, é chamada na thread que vai executá-lo (use um serviço por thread):
+    até ESCRITA_PARALELA lotes — intervalos independentes da mesma aba — sobem ao mesmo tempo.
+    ao_gravar(lote) é chamado a cada lote (ou metade de lote dividido) confirmado — diário de retomada.
+    Retorna quantas requisições de escrita foram feitas (incluindo as de lotes divididos).
+    """
+    global _pool_escrita
+    etapa_atual, destino_atual = getattr(_contexto, "etapa", None), getattr(_contexto, "destino", None)
+
+    def _um(i_lote):
+        i, lote = i_lote
+        with etapa(etapa_atual or "escrita", destino_atual, registrar=False):
+            return _gravar_lote(nova_requisicao, lote, f"{desc} (lote {i}/{len(lotes)})", log, tentativas, backoff,
+                                ao_gravar)
+
+    if not paralelo or ESCRITA_PARALELA <= 1 or len(lotes) <= 1:
+        return sum(_um(x) for x in enumerate(lotes, start=1))
+    with _pool_lock:
+        if _pool_escrita is None:
+            _pool_escrita = ThreadPoolExecutor(max_workers=ESCRITA_PARALELA, thread_name_prefix="escrita-lote")
+    futuros = [_pool_escrita.submit(_um, x) for x in enumerate(lotes, start=1)]
+    try:
+        return sum(f.result() for f in futuros)
+    finally:
+        for f in futuros:
+            f.cancel()
+
+def requisicoes_legadas(total_linhas: int, chunk: int, com_clear: bool = True, com_timestamp: bool = True) -> int:
+    """Quantas chamadas o fluxo antigo faria: clear + ceil(n/chunk) updates + timestamp."""
+    return int(com_clear) + math.ceil(total_linhas / chunk) + int(com_timestamp)
+
+_economia: Dict[str, int] = {"legado": 0, "real": 0}
+_economia_lock = threading.Lock()
+
+def registrar_economia(legado: int, real: int):
+    with _economia_lock:
+        _economia["legado"] += legado
+        _economia["real"]   += real
+
+def resumo_economia() -> str:
+    with _economia_lock:
+        legado, real = _economia["legado"], _economia["real"]
+    return f"{real} requisições de escrita (fluxo antigo: {legado}; economizadas: {legado - real})"
@@ -0,0 +1,14 @@
+"""Casos de borda e comparação bit a bit da conversão de números pt-BR (testes e benchmark)."""
+import math, struct
+
+BORDAS = ["", " ", "-", "--1", ".", ",", "-0", "0", "-0,0", ".5", "5.", "-,5", "1.2.3", "1,2,3",
+          "1.234,56", "1,234.56", "R$ 10,00", "R$ -1.000.000,01", "abc", "12abc34", "1e5", "nan",
+          "inf", "１２３", "٣", "1_000", " 7 ", "(10,00)", "10%", "9" * 400]
+
+def mesmo_valor(a, b) -> bool:
+    """Mesmo tipo e, para float, os mesmos bits (distingue -0.0 de 0.0; NaN == NaN)."""
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, float):
+        return struct.pack("<d", a) == struct.pack("<d", b) or (math.isnan(a) and math.isnan(b))
+    return a == b
@@ -0,0 +1,187 @@
+"""
+Delta por chave (sheets_comum.delta_por_chave) e deslocamentos no destino (exportar.deslocar_linhas):
+aplicar a estrutura e os blocos sobre o conteúdo atual tem de dar exatamente o novo.
+"""
+import os, sys, json, random
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import sheets_comum
+from sheets_comum import delta_por_chave, diferencas, linhas_iguais
+import exportar_esteira_carteira as E
+
+CAB = ["Projeto", "Valor Considerado", "Status Esteira", "Valor Recebido", "Unidade"]
+
+def _linha(chave, valor=1.0, status="Em obra", unidade="U1"):
+    return [chave, valor, status, valor / 2, unidade]
+
+def _tabela(chaves, **kw):
+    return [CAB] + [_linha(c, **kw) for c in chaves]
+
+def aplicar(atual, plano, largura=5):
+    """Simula o destino: insertRange/deleteRange na ordem da estrutura e depois os blocos."""
+    grade = [list(r) for r in atual]
+    for op, linha, n in plano["estrutura"]:
+        if op == "inserir":
+            grade[linha:linha] = [[""] * largura for _ in range(n)]
+        else:
+            del grade[linha:linha + n]
+    for r0, linhas in plano["blocos"]:
+        for k, r in enumerate(linhas):
+            while len(grade) < r0 + k:
+                grade.append([""] * largura)
+            grade[r0 - 1 + k] = list(r)
+    return grade
+
+def _confere(atual, novo):
+    plano = delta_por_chave(atual, novo)
+    grade = aplicar(atual, plano)
+    assert len(grade) == len(novo)
+    assert all(linhas_iguais(a, n) for a, n in zip(grade, novo))
+    assert plano["regravadas"] == sum(len(b) for _, b in plano["blocos"])
+    return plano
+
+def test_insercao_e_remocao_no_meio():
+    atual = _tabela([f"P{i}" for i in range(20)])
+    chaves = [f"P{i}" for i in range(20) if i not in (5, 6)]
+    chaves[10:10] = ["N1", "N2", "N3"]
+    plano = _confere(atual, _tabela(chaves))
+    assert (plano["inseridos"], plano["removidos"], plano["alterados"]) == (3, 2, 0)
+    assert plano["regravadas"] == 3  # só as linhas novas; o resto desliza com os deslocamentos
+    assert [op for op, _, _ in plano["estrutura"]] == ["inserir", "remover"]  # de baixo para cima
+    assert plano["estrutura"][0][1] > plano["estrutura"][1][1]
+
+def test_alteracao_sem_mudar_estrutura():
+    atual = _tabela(["A", "B", "C"])
+    novo = [list(r) for r in atual]
+    novo[2][1] = 99.0
+    plano = _confere(atual, novo)
+    assert plano["estrutura"] == [] and plano["blocos"] == [(3, [novo[2]])]
+    assert plano["alterados"] == 1
+
+def test_chaves_duplicadas():
+    atual = _tabela(["A", "B", "B", "C"])
+    novo = _tabela(["A", "B", "C", "B"])
+    plano = _confere(atual, novo)
+    assert (plano["inseridos"], plano["removidos"]) == (0, 0)
+
+def test_chaves_em_branco_so_casam_com_linha_identica():
+    vazia1 = ["", 1.0, "x", 0.5, "U1"]
+    vazia2 = ["", 2.0, "x", 1.0, "U1"]
+    atual = [CAB, _linha("A"), vazia1, _linha("B")]
+    novo = [CAB, _linha("A"), vazia2, _linha("B")]
+    plano = _confere(atual, novo)
+    assert plano["inseridos"] == 1 and plano["removidos"] == 1
+    # a idêntica casa e não é regravada
+    assert _confere(atual, [list(r) for r in atual])["regravadas"] == 0
+
+def test_reordenacao_completa_cai_no_posicional():
+    chaves = [f"P{i}" for i in range(30)]
+    atual = _tabela(chaves)
+    novo = _tabela(list(reversed(chaves)))
+    plano = _confere(atual, novo)
+    blocos_pos, _ = diferencas(atual, novo)
+    posicional = sum(len(b) for _, b in blocos_pos)
+    # casar uma ou outra linha por acaso não compensa os deslocamentos (DELTA_ECONOMIA_MIN)
+    assert plano["regravadas"] > posicional * (1 - E.DELTA_ECONOMIA_MIN)
+
+def test_cabecalho_alterado():
+    atual = _tabela(["A", "B"])
+    novo = _tabela(["A", "B"])
+    novo[0] = ["Código"] + CAB[1:]
+    plano = _confere(atual, novo)
+    assert plano["blocos"][0] == (1, [novo[0]])
+    assert (plano["inseridos"], plano["removidos"], plano["alterados"]) == (0, 0, 0)  # contagens sem o cabeçalho
+
+@pytest.mark.parametrize("seed", range(40))
+def test_edicoes_aleatorias(seed):
+    rnd = random.Random(seed)
+    chaves = [f"P{i}" for i in range(rnd.randint(0, 60))]
+    atual = _tabela(chaves, valor=1.0)
+    novo_chaves = list(chaves)
+    for _ in range(rnd.randint(0, 8)):
+        if novo_chaves and rnd.random() < 0.4:
+            del novo_chaves[rnd.randrange(len(novo_chaves))]
+        else:
+            novo_chaves.insert(rnd.randint(0, len(novo_chaves)), f"N{rnd.randint(0, 999)}")
+    novo = _tabela(novo_chaves, valor=1.0)
+    for r in novo[1:]:
+        if rnd.random() < 0.1:
+            r[1] = float(rnd.randint(2, 9))
+        if rnd.random() < 0.05:
+            r[0] = ""
+    _confere(atual, novo)
+
+# ============== deslocar_linhas / gravar_delta contra uma API que só registra ==============
+class _Req:
+    def __init__(self, api, nome, body, resposta):
+        self.methodId, self.uri = f"sheets.spreadsheets.{nome}", ""
+        self.body = json.dumps(body) if body is not None else None
+        self._api, self._nome, self._corpo, self._resposta = api, nome, body, resposta
+
+    def execute(self):
+        self._api.chamadas.append((self._nome, self._corpo))
+        return self._resposta
+
+class _Valores:
+    def __init__(self, api):
+        self._api = api
+
+    def batchUpdate(self, spreadsheetId, body):
+        return _Req(self._api, "values.batchUpdate", body, {})
+
+class _Api:
+    def __init__(self, linhas_grade):
+        self.linhas_grade, self.chamadas = linhas_grade, []
+
+    def get(self, spreadsheetId, fields=None):
+        props = {"sheetId": 7, "title": E.ABA_DESTINO, "gridProperties": {"rowCount": self.linhas_grade}}
+        return _Req(self, "get", None, {"sheets": [{"properties": props}]})
+
+    def batchUpdate(self, spreadsheetId, body):
+        return _Req(self, "batchUpdate", body, {})
+
+    def values(self):
+        return _Valores(self)
+
+@pytest.fixture(autouse=True)
+def _sem_metricas():
+    yield
+    sheets_comum.reiniciar_metricas()  # nada para o atexit emitir
+
+def test_deslocar_linhas_estrutura_e_contagem():
+    api = _Api(linhas_grade=10)
+    estrutura = [("inserir", 8, 4), ("remover", 2, 1)]
+    assert E.deslocar_linhas(api, estrutura, linhas_base=9) == 1
+    nomes = [n for n, _ in api.chamadas]
+    assert nomes == ["get", "batchUpdate"]
+    pedidos = api.chamadas[1][1]["requests"]
+    # grade de 10 linhas, 9 usadas + 4 inseridas: faltam 3
+    assert pedidos[0] == {"appendDimension": {"sheetId": 7, "dimension": "ROWS", "length": 3}}
+    assert pedidos[1]["insertRange"]["range"] == {"sheetId": 7, "startRowIndex": 8, "endRowIndex": 12,
+                                                  "startColumnIndex": 0, "endColumnIndex": len(E.PROJECAO)}
+    assert pedidos[2]["deleteRange"]["range"]["startRowIndex"] == 2
+    assert pedidos[1]["insertRange"]["shiftDimension"] == pedidos[2]["deleteRange"]["shiftDimension"] == "ROWS"
+
+def test_deslocar_linhas_sem_nada_a_fazer():
+    api = _Api(linhas_grade=10)
+    assert E.deslocar_linhas(api, [], linhas_base=5) == 0
+    assert [n for n, _ in api.chamadas] == ["get"]
+
+def test_gravar_delta_reordenado_nao_desloca():
+    chaves = [f"P{i}" for i in range(30)]
+    api = _Api(linhas_grade=100)
+    reqs, relatorio = E.gravar_delta(api, None, _tabela(chaves), _tabela(list(reversed(chaves))), extras=())
+    assert "batchUpdate" not in [n for n, _ in api.chamadas]  # nada de insertRange/deleteRange
+    assert reqs >= 1 and relatorio["regravadas"] > 0
+
+def test_gravar_delta_insercao_no_meio_desloca():
+    chaves = [f"P{i}" for i in range(200)]
+    novo = list(chaves)
+    novo[100:100] = ["N1"]
+    api = _Api(linhas_grade=1000)
+    reqs, relatorio = E.gravar_delta(api, None, _tabela(chaves), _tabela(novo), extras=())
+    nomes = [n for n, _ in api.chamadas]
+    assert nomes.count("batchUpdate") == 1 and relatorio["regravadas"] == 1
+    gravado = [d for n, c in api.chamadas if n == "values.batchUpdate" for d in c["data"]]
+    assert gravado == [{"range": f"{E.ABA_DESTINO}!A102", "values": [_linha("N1")]}]
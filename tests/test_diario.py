@@ -0,0 +1,110 @@
+"""
+Retomada de escrita: linhas anotadas por lote (linhas_do_lote, inclusive de lotes divididos por
+dividir_lote), desconto do que já foi gravado (descontar_feitos) e o diário em disco (estado_esteira).
+"""
+import os, sys
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import estado_esteira
+from estado_esteira import (abrir_diario, diario_parcial, diario_plano, diario_lote, diario_concluido,
+                            encerrar_diario)
+from sheets_comum import linhas_do_lote, descontar_feitos, dividir_lote, planejar_escrita
+
+DIARIO = "teste_diario.json"
+
+def _linhas(ini, n):
+    return [[f"P{ini + k}", float(k)] for k in range(n)]
+
+def _folhas(lote):
+    """Divide o lote até não dar mais (como _gravar_lote faz em falhas repetidas)."""
+    partes = dividir_lote(lote)
+    if partes is None:
+        return [lote]
+    return _folhas(partes[0]) + _folhas(partes[1])
+
+# ============== linhas_do_lote / dividir_lote ==============
+def test_linhas_do_lote_ignora_extras():
+    lote = [{"range": "BD_Esteira!G2", "values": [["16/10/2026 10:00:00"]]},
+            {"range": "BD_Esteira!A10", "values": _linhas(10, 3)},
+            {"range": "BD_Esteira!A20", "values": []}]
+    assert linhas_do_lote(lote) == [(10, 3)]
+
+def test_metades_de_um_valuerange_cobrem_o_original():
+    lote = [{"range": "BD_Esteira!A10", "values": _linhas(10, 7)}]
+    a, b = dividir_lote(lote)
+    assert linhas_do_lote(a) == [(10, 3)] and linhas_do_lote(b) == [(13, 4)]
+    assert a[0]["values"] + b[0]["values"] == lote[0]["values"]
+
+def test_divisao_ate_o_fim_anota_cada_linha_uma_vez():
+    lote = [{"range": "BD_Esteira!G2", "values": [["ts"]]},
+            {"range": "BD_Esteira!A2", "values": _linhas(2, 5)},
+            {"range": "BD_Esteira!A40", "values": _linhas(40, 6)}]
+    folhas = _folhas(lote)
+    assert all(len(f) == 1 and len(f[0].get("values", [])) <= 1 for f in folhas)
+    anotadas = sorted(x for f in folhas for ini, n in linhas_do_lote(f) for x in range(ini, ini + n))
+    assert anotadas == list(range(2, 7)) + list(range(40, 46))
+
+def test_lote_de_uma_linha_nao_divide():
+    assert dividir_lote([{"range": "BD_Esteira!A5", "values": _linhas(5, 1)}]) is None
+
+# ============== descontar_feitos ==============
+def test_descontar_lotes_divididos():
+    blocos = [(2, _linhas(2, 20))]
+    lote, = planejar_escrita("BD_Esteira", blocos, limite=10**9)
+    a, b = dividir_lote(lote)
+    # só a 2ª metade chegou a ser gravada antes da queda
+    assert descontar_feitos(blocos, linhas_do_lote(b)) == [(2, blocos[0][1][:10])]
+
+def test_descontar_feitos_sobrepostos():
+    blocos = [(1, _linhas(1, 10)), (30, _linhas(30, 5))]
+    feitos = [(1, 5), (3, 5), (4, 2), (31, 1), (33, 10)]
+    (_, b1), (_, b2) = blocos
+    assert descontar_feitos(blocos, feitos) == [(8, b1[7:]), (30, b2[:1]), (32, b2[2:3])]
+
+def test_descontar_sem_feitos_e_tudo_feito():
+    blocos = [(5, _linhas(5, 3))]
+    assert descontar_feitos(blocos, []) == blocos
+    assert descontar_feitos(blocos, [(1, 100)]) == []
+
+# ============== diário em disco ==============
+@pytest.fixture
+def diario(tmp_path, monkeypatch):
+    monkeypatch.setattr(estado_esteira, "ESTADO_DIR", str(tmp_path))
+    monkeypatch.setattr(estado_esteira, "FORCAR", False)
+    return abrir_diario(DIARIO)
+
+def test_plano_e_feitos_sobrevivem_a_queda(diario):
+    diario_plano(diario, DIARIO, "dest", "h1", [(1, 10), (20, 5)])
+    diario_lote(diario, DIARIO, "dest", "h1", [(1, 4)])
+    reaberto = abrir_diario(DIARIO)
+    assert diario_parcial(reaberto, "dest", "h1") == {"hash": "h1", "plano": [[1, 10], [20, 5]], "feitos": [[1, 4]]}
+
+def test_hash_diferente_zera_os_feitos(diario):
+    diario_plano(diario, DIARIO, "dest", "h1", [(1, 10)])
+    diario_lote(diario, DIARIO, "dest", "h1", [(1, 4)])
+    assert diario_parcial(diario, "dest", "h2") is None  # outro conteúdo: nada a aproveitar
+    diario_plano(diario, DIARIO, "dest", "h2", [(1, 8)])
+    assert diario_parcial(diario, "dest", "h2") == {"hash": "h2", "plano": [[1, 8]], "feitos": []}
+    diario_lote(diario, DIARIO, "dest", "h3", [(2, 1)])
+    assert diario_parcial(abrir_diario(DIARIO), "dest", "h3") == {"hash": "h3", "plano": None, "feitos": [[2, 1]]}
+
+def test_parcial_devolvido_e_copia(diario):
+    diario_lote(diario, DIARIO, "dest", "h1", [(1, 4)])
+    diario_parcial(diario, "dest", "h1")["feitos"].append([9, 9])
+    assert diario_parcial(diario, "dest", "h1")["feitos"] == [[1, 4]]
+
+def test_concluido_e_encerramento(diario):
+    diario_lote(diario, DIARIO, "a", "h", [(1, 2)])
+    diario_lote(diario, DIARIO, "b", "h", [(1, 2)])
+    diario_concluido(diario, DIARIO, "a", "h")
+    assert abrir_diario(DIARIO) == {"concluidos": {"a": "h"}, "parciais": {"b": {"hash": "h", "plano": None, "feitos": [[1, 2]]}}}
+    encerrar_diario(DIARIO, diario, ativos={"b"})
+    assert abrir_diario(DIARIO)["parciais"].keys() == {"b"} and abrir_diario(DIARIO)["concluidos"] == {}
+    encerrar_diario(DIARIO, diario)  # sem ativos: nada pendente, o arquivo some
+    assert not os.path.exists(os.path.join(estado_esteira.ESTADO_DIR, DIARIO))
+
+def test_forcar_ignora_o_diario(diario, monkeypatch):
+    diario_lote(diario, DIARIO, "dest", "h1", [(1, 4)])
+    monkeypatch.setattr(estado_esteira, "FORCAR", True)
+    assert abrir_diario(DIARIO) == {"concluidos": {}, "parciais": {}}
@@ -0,0 +1,132 @@
+"""
+Camada de execução (sheets_comum): classificação de erros, Retry-After, cota de leitura x escrita
+por methodId e orçamento de retries (por destino/etapa e da execução).
+"""
+import os, sys, json, time, email.utils, http.client, socket
+import pytest
+import httplib2
+from googleapiclient.errors import HttpError
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import sheets_comum as sc
+
+def _erro(status, motivo=None, retry_after=None):
+    cab = {"status": str(status)}
+    if retry_after is not None:
+        cab["retry-after"] = retry_after
+    corpo = {"error": {"code": status, "errors": [{"reason": motivo}] if motivo else []}}
+    return HttpError(httplib2.Response(cab), json.dumps(corpo).encode("utf-8"))
+
+@pytest.mark.parametrize("erro, esperado", [
+    (_erro(429), True),
+    (_erro(500), True),
+    (_erro(502), True),
+    (_erro(503), True),
+    (_erro(504), True),
+    (_erro(408), True),
+    (_erro(403, "rateLimitExceeded"), True),
+    (_erro(403, "RATE_LIMIT_EXCEEDED"), True),
+    (_erro(403, "forbidden"), False),
+    (_erro(403), False),
+    (_erro(400, "badRequest"), False),
+    (_erro(401), False),
+    (_erro(404), False),
+    (socket.timeout("timed out"), True),
+    (ConnectionResetError(), True),
+    (http.client.RemoteDisconnected(), True),
+    (httplib2.ServerNotFoundError(), True),
+    (ValueError("bug"), False),
+    (KeyError("x"), False),
+])
+def test_retentavel(erro, esperado):
+    assert sc.retentavel(erro) is esperado
+
+def test_retry_after_em_segundos_e_data():
+    assert sc.retry_after(_erro(429, retry_after="7")) == 7.0
+    assert sc.retry_after(_erro(429, retry_after="1.5")) == 1.5
+    assert sc.retry_after(_erro(429, retry_after="-3")) == 0.0
+    daqui_a_30 = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 25 <= sc.retry_after(_erro(503, retry_after=daqui_a_30)) <= 30
+    no_passado = email.utils.formatdate(time.time() - 60, usegmt=True)
+    assert sc.retry_after(_erro(503, retry_after=no_passado)) == 0.0
+
+@pytest.mark.parametrize("valor", [None, "", "amanhã"])
+def test_retry_after_ausente_ou_invalido(valor):
+    assert sc.retry_after(_erro(429, retry_after=valor)) is None
+    assert sc.retry_after(OSError()) is None
+
+class _Req:
+    def __init__(self, methodId=None):
+        if methodId is not None:
+            self.methodId = methodId
+
+@pytest.mark.parametrize("metodo, tipo", [
+    ("sheets.spreadsheets.get", "leitura"),
+    ("sheets.spreadsheets.getByDataFilter", "leitura"),
+    ("sheets.spreadsheets.values.get", "leitura"),
+    ("sheets.spreadsheets.values.batchGet", "leitura"),
+    ("sheets.spreadsheets.values.batchGetByDataFilter", "leitura"),
+    ("sheets.spreadsheets.batchUpdate", "escrita"),
+    ("sheets.spreadsheets.values.update", "escrita"),
+    ("sheets.spreadsheets.values.batchUpdate", "escrita"),
+    ("sheets.spreadsheets.values.append", "escrita"),
+    ("sheets.spreadsheets.values.clear", "escrita"),
+    ("sheets.spreadsheets.values.batchClear", "escrita"),
+    ("drive.files.get", None),
+    (None, "leitura"),  # função sem methodId
+])
+def test_tipo_cota(metodo, tipo):
+    assert sc.tipo_cota(_Req(metodo)) == tipo
+
+# ============== orçamento de retries e executar ==============
+@pytest.fixture
+def orcamento(monkeypatch):
+    monkeypatch.setattr(sc, "ORCAMENTO_RETRIES", 3)
+    monkeypatch.setattr(sc, "ORCAMENTO_EXECUCAO", 5)
+    monkeypatch.setattr(sc.time, "sleep", lambda s: None)
+    monkeypatch.setattr(sc, "REQ_POR_MINUTO", 10**9)
+    sc.reiniciar_orcamento()
+    sc.reiniciar_cota()
+    yield
+    sc.reiniciar_orcamento()
+    sc.reiniciar_metricas()
+
+def _gastar(destino):
+    with sc.etapa("destino", destino=destino, registrar=False):
+        n = 0
+        while sc.consumir_orcamento():
+            n += 1
+        return n
+
+def test_orcamento_por_unidade_e_teto_da_execucao(orcamento):
+    assert [_gastar(d) for d in "ABC"] == [3, 2, 0]
+    sc.reiniciar_orcamento()
+    assert _gastar("C") == 3
+
+def test_executar_erro_definitivo_sobe_na_hora(orcamento):
+    chamadas = []
+    def falha():
+        chamadas.append(1)
+        raise _erro(404)
+    with pytest.raises(HttpError):
+        sc.executar(falha, "teste", log=lambda m: None)
+    assert len(chamadas) == 1
+
+def test_executar_retentavel_ate_dar_certo(orcamento):
+    respostas = [_erro(503), _erro(429, retry_after="1"), {"ok": True}]
+    def chamar():
+        r = respostas.pop(0)
+        if isinstance(r, Exception):
+            raise r
+        return r
+    with sc.etapa("destino", destino="X", registrar=False):
+        assert sc.executar(chamar, "teste", log=lambda m: None) == {"ok": True}
+        assert _gastar("X") == 1  # 2 dos 3 retries do destino foram usados
+
+def test_executar_para_quando_o_orcamento_acaba(orcamento):
+    def sempre_503():
+        raise _erro(503)
+    with sc.etapa("destino", destino="Y", registrar=False):
+        with pytest.raises(RuntimeError, match="orçamento de retries esgotado") as exc:
+            sc.executar(sempre_503, "teste", log=lambda m: None, tentativas=50)
+    assert isinstance(exc.value.__cause__, HttpError)
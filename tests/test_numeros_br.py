@@ -0,0 +1,54 @@
+"""
+Conversão de números pt-BR em lote (clean_column_br) x valor a valor (clean_number_br):
+o resultado em lote tem de ser idêntico, bit a bit, com e sem pandas.
+"""
+import os, sys, random
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import exportar_esteira_carteira as E
+from casos_numeros_br import BORDAS, mesmo_valor
+
+def _amostra(seed: int):
+    rnd = random.Random(seed)
+    base = [f"R$ {rnd.randint(0, 999_999):,}".replace(",", ".") + f",{rnd.randint(0, 99):02d}" for _ in range(50)]
+    base += [str(rnd.uniform(-1e6, 1e6)) for _ in range(5)] + BORDAS
+    alfabeto = "0123456789,.-R$ ab"
+    return ([rnd.choice(base) for _ in range(500)] +
+            ["".join(rnd.choice(alfabeto) for _ in range(rnd.randint(0, 12))) for _ in range(500)])
+
+@pytest.fixture(params=["pandas", "python puro"])
+def motor(request, monkeypatch):
+    if request.param == "pandas":
+        pytest.importorskip("pandas")
+        monkeypatch.setattr(E, "_np_pd", None)
+    else:
+        monkeypatch.setattr(E, "_np_pd", False)
+    E._clean_number_br_str.cache_clear()
+    return request.param
+
+@pytest.mark.parametrize("seed", range(40))
+def test_lote_igual_a_valor_a_valor(motor, seed):
+    valores = _amostra(seed)
+    for v, obtido in zip(valores, E.clean_column_br(valores)):
+        assert mesmo_valor(E.clean_number_br(v), obtido), f"divergência em {v!r}"
+
+def test_bordas(motor):
+    for v, obtido in zip(BORDAS, E.clean_column_br(BORDAS)):
+        assert mesmo_valor(E.clean_number_br(v), obtido), f"divergência em {v!r}"
+
+def test_cache_nao_mistura_tipos(motor):
+    # 0.0/-0.0 e 1/True seriam a mesma chave num cache por valor
+    mistos = [None, 1, 1.0, True, 0.0, -0.0, "1,5", "", 10**20]
+    for v, obtido in zip(mistos, E.clean_column_br(mistos)):
+        assert mesmo_valor(E.clean_number_br(v), obtido), f"divergência em {v!r}"
+
+def test_coluna_vazia():
+    assert E.clean_column_br([]) == []
+
+def test_leitura_tipada_numeros_passam_direto():
+    # números sem formatação não passam por clean_number_br (ver LEITURA_TIPADA): 1e-05 continua número
+    assert E.clean_column_br([1e-05, 3, "1,5", None]) == [1e-05, 3.0, 1.5, ""]
+
+def test_texto_local():
+    assert [E.texto_local(v) for v in [123, 123.0, 1.5, True, "P-1", ""]] == ["123", "123", "1,5", "TRUE", "P-1", ""]